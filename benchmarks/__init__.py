@@ -0,0 +1,5 @@
+"""Benchmarks for the Dovecot Quotas integration.
+
+Run from the repository root, e.g. `python -m benchmarks.bench_parser`.
+They share the fake doveadm and SSH server of the tests.
+"""
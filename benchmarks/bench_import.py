@@ -0,0 +1,117 @@
+"""Import-time and setup-time benchmark.
+
+    python -m benchmarks.bench_import [--repeat 10] [--accounts 1000]
+
+Every module is imported in a fresh interpreter, after the Home Assistant
+modules it builds on, so only the integration's own import cost is timed.
+The report shows whether paramiko was pulled in: it should only be loaded
+by the SSH backend. The setup part times creating the account sensors for
+`--accounts` accounts. Modules that need Home Assistant are reported as
+skipped when it isn't installed.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+from tests import ROOT, load_integration
+
+PACKAGE = "custom_components.dovecot_quotas"
+
+# Home Assistant modules imported before the clock starts.
+HA_MODULES = (
+    "homeassistant.config_entries",
+    "homeassistant.components.sensor",
+    "homeassistant.helpers.aiohttp_client",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.selector",
+    "homeassistant.helpers.storage",
+    "homeassistant.helpers.update_coordinator",
+)
+
+# (label, module, needs Home Assistant)
+TARGETS = (
+    ("integration", PACKAGE, True),
+    ("config flow", f"{PACKAGE}.config_flow", True),
+    ("sensor platform", f"{PACKAGE}.sensor", True),
+    ("api", f"{PACKAGE}.api", False),
+    ("http backend", f"{PACKAGE}.http_api", False),
+    ("ssh backend", f"{PACKAGE}.ssh_api", False),
+)
+
+SNIPPET = """
+import importlib, sys, time
+{prepare}
+start = time.perf_counter()
+importlib.import_module({module!r})
+print(time.perf_counter() - start, "paramiko" in sys.modules)
+"""
+
+
+def time_import(module: str, needs_ha: bool) -> tuple[float, bool]:
+    """Import a module in a new interpreter; return seconds and paramiko use."""
+    if needs_ha:
+        prepare = "\n".join(f"import {name}" for name in HA_MODULES)
+    else:
+        prepare = "from tests import load_integration; load_integration()"
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(prepare=prepare, module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, paramiko = result.stdout.split()
+    return float(seconds), paramiko == "True"
+
+
+def time_setup(accounts: int) -> float:
+    """Return the seconds it takes to create the sensors of the accounts."""
+    from custom_components.dovecot_quotas.sensor import (  # noqa: PLC0415
+        SENSOR_DESCRIPTIONS,
+        AccountSensor,
+    )
+
+    coordinator = SimpleNamespace(data={})
+    start = time.perf_counter()
+    for i in range(accounts):
+        for description in SENSOR_DESCRIPTIONS:
+            AccountSensor(coordinator, "entry", description, f"user{i}@example.com")  # type: ignore[arg-type]
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=1000)
+    args = parser.parse_args()
+
+    try:
+        import homeassistant  # noqa: F401, PLC0415
+    except ImportError:
+        has_ha = False
+    else:
+        has_ha = True
+
+    print(f"{'module':<16} {'median ms':>10} {'paramiko':>9}")
+    for label, module, needs_ha in TARGETS:
+        if needs_ha and not has_ha:
+            print(f"{label:<16} {'skipped, needs homeassistant':>20}")
+            continue
+        samples = [time_import(module, needs_ha) for _ in range(args.repeat)]
+        median = statistics.median(seconds for seconds, _ in samples)
+        print(f"{label:<16} {median * 1000:>10.1f} {str(samples[0][1]):>9}")
+
+    if has_ha:
+        seconds = time_setup(args.accounts)
+        print(f"setup: {args.accounts} accounts' sensors in {seconds * 1000:.1f} ms")
+    else:
+        print("setup: skipped, needs homeassistant")
+
+
+if __name__ == "__main__":
+    load_integration()
+    main()
@@ -0,0 +1,125 @@
+"""Compare the streaming quota parser with the original one.
+
+    python -m benchmarks.bench_parser [--lines 100000] [--repeat 5]
+
+The original parser read all of 'doveadm quota get -A | grep STORAGE' into
+one string and split every line with a regex into a dict per mailbox. The
+streaming parser reads 'doveadm -f tab quota get -A' from the channel in
+chunks and adds typed records to a columnar snapshot. Both get the same
+number of STORAGE lines.
+"""
+
+import argparse
+from collections.abc import Callable
+import re
+import statistics
+import threading
+import time
+import tracemalloc
+
+from tests import load_integration
+
+load_integration()
+
+from custom_components.dovecot_quotas.parser import parse_quota_lines  # noqa: E402
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot  # noqa: E402
+from custom_components.dovecot_quotas.ssh import READ_CHUNK_SIZE, read_lines  # noqa: E402
+
+from tests.fake_doveadm import HEADER, STORAGE_LIMIT, username  # noqa: E402
+
+
+class BufferChannel:
+    """Hand out a byte string the way a paramiko channel does."""
+
+    def __init__(self, data: bytes) -> None:
+        self._view = memoryview(data)
+        self._offset = 0
+        self.status_event = threading.Event()
+        self.status_event.set()
+        self.exit_status = 0
+
+    def recv(self, size: int) -> bytes:
+        chunk = self._view[self._offset : self._offset + size].tobytes()
+        self._offset += len(chunk)
+        return chunk
+
+    def close(self) -> None:
+        pass
+
+
+def legacy_parse(output: str) -> dict[str, dict]:
+    """The parser the integration started out with."""
+    quotas = {}
+    for line in output.splitlines():
+        mailbox, *_, used, quota, _ = re.split(r" {1,}", line)
+        used = float(used)
+        quota = float(quota) if quota != "-" else None
+        percentage_used = round(float(used) / float(quota) * 100, 1) if quota else None
+        free = float(quota) - float(used) if quota else None
+        percentage_free = 100 - percentage_used if percentage_used else None
+        quotas[mailbox] = {
+            "name": mailbox,
+            "used": used,
+            "quota": quota,
+            "percentage_used": percentage_used,
+            "free": free,
+            "percentage_free": percentage_free,
+        }
+    return quotas
+
+
+def streaming_parse(output: bytes) -> QuotaSnapshot:
+    """Read and parse the output as the SSH backend does."""
+    quotas = QuotaSnapshot()
+    for record in parse_quota_lines(read_lines(BufferChannel(output))):  # type: ignore[arg-type]
+        quotas.add(record)
+    return quotas
+
+
+def measure(func: Callable[[], object], repeat: int) -> tuple[float, float]:
+    """Return the median run time in seconds and the peak memory in MiB."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    users = [username(i) for i in range(args.lines)]
+    legacy_output = "".join(
+        f"{user} User quota STORAGE {i % STORAGE_LIMIT} {STORAGE_LIMIT} 0\n"
+        for i, user in enumerate(users)
+    )
+    tab_output = (
+        HEADER
+        + "\n"
+        + "".join(
+            f"{user}\tUser quota\tSTORAGE\t{i % STORAGE_LIMIT}\t{STORAGE_LIMIT}\t0\n"
+            for i, user in enumerate(users)
+        )
+    ).encode()
+    assert len(legacy_parse(legacy_output)) == len(streaming_parse(tab_output))
+
+    print(f"{args.lines} lines, {READ_CHUNK_SIZE // 1024} KiB reads")
+    print(f"{'parser':<10} {'median s':>9} {'lines/s':>11} {'peak MiB':>9}")
+    for name, func in (
+        ("legacy", lambda: legacy_parse(legacy_output)),
+        ("streaming", lambda: streaming_parse(tab_output)),
+    ):
+        seconds, peak = measure(func, args.repeat)
+        print(f"{name:<10} {seconds:>9.3f} {args.lines / seconds:>11,.0f} {peak:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""End-to-end refresh benchmark against the fake SSH server.
+
+    python -m benchmarks.bench_refresh [--users 1000 10000 100000]
+        [--batch 500] [--rounds 20] [--churn 0.01] [--latency 0.0]
+        [--drop-every 0] [--accounts 200]
+
+For every user count it measures, over the SSH backend:
+  - full scan: latency of 'quota get -A' and the parse throughput;
+  - targeted refreshes: latency of polling `--batch` accounts at a time
+    and merging them into the snapshot and the server totals, as the
+    coordinator does;
+  - the longest the event loop was blocked, during the full scan (which
+    includes building the snapshot and totals) and during the refreshes;
+  - the peak Python memory of a full scan;
+  - the entity state writes per refresh: the integration is set up in a
+    test Home Assistant instance with `--accounts` selected accounts, and
+    the states written while refreshing all of them are counted, against
+    the number of sensors. This part needs Home Assistant's test plugin.
+Between rounds `--churn` of the users change their usage. With
+`--drop-every N` the session is cut halfway through every Nth refresh.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+
+from tests import load_integration
+
+load_integration()
+
+from custom_components.dovecot_quotas import (  # noqa: E402
+    api as api_module,
+    group as group_module,
+)
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot  # noqa: E402
+from custom_components.dovecot_quotas.ssh_api import SSHQuotasAPI  # noqa: E402
+from custom_components.dovecot_quotas.totals import ServerTotals  # noqa: E402
+
+from tests.fake_doveadm import STORAGE_LIMIT, FakeDoveadm, FakeSSHServer  # noqa: E402
+
+
+class LoopMonitor:
+    """Track the longest time the event loop didn't get to run a tick."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self._interval = interval
+        self.max_block = 0.0
+
+    async def __aenter__(self) -> "LoopMonitor":
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self._task.cancel()
+
+    def reset(self) -> float:
+        """Return the longest block so far and start over."""
+        max_block, self.max_block = self.max_block, 0.0
+        return max_block
+
+    async def _tick(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self._interval)
+            block = time.perf_counter() - start - self._interval
+            self.max_block = max(self.max_block, block)
+
+
+async def bench(users: int, args: argparse.Namespace) -> dict[str, float]:
+    """Run the benchmark for one user count."""
+    rng = random.Random(users)
+    doveadm = FakeDoveadm(users=users, latency=args.latency)
+    results: dict[str, float] = {}
+    with FakeSSHServer(doveadm) as server:
+        api = SSHQuotasAPI("127.0.0.1", server.username, server.password, server.port)
+        await api.test_connection()
+        async with LoopMonitor() as monitor:
+            start = time.perf_counter()
+            quotas = QuotaSnapshot()
+            quotas.update(await api.get_quotas())
+            results["full_scan_s"] = time.perf_counter() - start
+            parse = api.timings.percentile("parse", 50) or float("nan")
+            results["parse_records_s"] = 2 * users / parse
+            totals = ServerTotals()
+            totals.update(quotas, None, quotas.diff(None))
+            await asyncio.sleep(0.01)
+            results["scan_block_ms"] = monitor.reset() * 1000
+
+            accounts = doveadm.users
+            latencies: list[float] = []
+            failed = 0
+            for round_ in range(args.rounds):
+                for user in rng.sample(accounts, int(users * args.churn)):
+                    doveadm.storage[user] = float(rng.randrange(STORAGE_LIMIT))
+                if args.drop_every and round_ % args.drop_every == 0:
+                    server.drop_after = args.batch
+                offset = round_ * args.batch % users
+                due = accounts[offset : offset + args.batch]
+                start = time.perf_counter()
+                fetched = await api.get_quotas(due)
+                previous, changes = quotas.merge(fetched, due)
+                totals.update(quotas, previous, changes)
+                latencies.append(time.perf_counter() - start)
+                failed += len(api.failed_accounts)
+            results["refresh_p50_s"] = statistics.median(latencies)
+            results["refresh_max_s"] = max(latencies)
+        results["refresh_block_ms"] = monitor.reset() * 1000
+        results["failed_accounts"] = failed
+
+        tracemalloc.start()
+        await api.get_quotas()
+        results["peak_mib"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        await api.close()
+    return results
+
+
+async def bench_entities(users: int, args: argparse.Namespace) -> dict[str, float]:
+    """Count the state writes of refreshes through Home Assistant.
+
+    The config entry, coordinator and sensor platform are set up as in
+    Home Assistant, against the fake server. Every round the usage of
+    `--churn` of the selected accounts changes and all of them are polled.
+    """
+    # Only available with Home Assistant's test plugin installed.
+    from homeassistant import loader  # noqa: PLC0415
+    from homeassistant.const import (  # noqa: PLC0415
+        EVENT_STATE_CHANGED,
+        EVENT_STATE_REPORTED,
+    )
+    from homeassistant.core import Event, callback  # noqa: PLC0415
+    from pytest_homeassistant_custom_component.common import (  # noqa: PLC0415
+        MockConfigEntry,
+        async_test_home_assistant,
+        mock_storage,
+    )
+
+    from custom_components.dovecot_quotas.const import (  # noqa: PLC0415
+        CONF_ACCOUNTS,
+        CONF_HOSTNAME,
+        CONF_MAX_COMMANDS_PER_MINUTE,
+        CONF_PASSWORD,
+        CONF_PORT,
+        CONF_USERNAME,
+        DOMAIN,
+    )
+
+    rng = random.Random(users)
+    doveadm = FakeDoveadm(users=users, latency=args.latency)
+    selected = doveadm.users[: args.accounts]
+    writes: list[int] = []
+    written = 0
+
+    @callback
+    def count_write(event: Event) -> None:
+        nonlocal written
+        written += 1
+
+    with (
+        FakeSSHServer(doveadm) as server,
+        mock_storage(),
+    ):
+        async with async_test_home_assistant() as hass:
+            # Load the integration from this checkout, without the warning.
+            hass.data.pop(loader.DATA_CUSTOM_COMPONENTS)
+            logging.getLogger(loader.__name__).setLevel(logging.ERROR)
+            entry = MockConfigEntry(
+                domain=DOMAIN,
+                data={
+                    CONF_HOSTNAME: "127.0.0.1",
+                    CONF_USERNAME: server.username,
+                    CONF_PASSWORD: server.password,
+                    CONF_PORT: server.port,
+                    CONF_ACCOUNTS: selected,
+                },
+                options={CONF_MAX_COMMANDS_PER_MINUTE: 60000},
+            )
+            entry.add_to_hass(hass)
+            assert await hass.config_entries.async_setup(entry.entry_id)
+            await hass.async_block_till_done()
+            coordinator = hass.data[DOMAIN][entry.entry_id]
+            hass.bus.async_listen(EVENT_STATE_CHANGED, count_write)
+            hass.bus.async_listen(
+                EVENT_STATE_REPORTED, count_write, callback(lambda data: True)
+            )
+            for _ in range(args.rounds):
+                for user in rng.sample(selected, int(len(selected) * args.churn)):
+                    doveadm.storage[user] = float(rng.randrange(STORAGE_LIMIT))
+                written = 0
+                coordinator.scheduler.poll_now(selected)
+                await coordinator.async_refresh()
+                await hass.async_block_till_done()
+                writes.append(written)
+            sensors = len(hass.states.async_entity_ids("sensor"))
+            await hass.config_entries.async_unload(entry.entry_id)
+            await hass.async_stop(force=True)
+    return {"writes": statistics.mean(writes), "writes_all": sensors}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--churn", type=float, default=0.01)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--drop-every", type=int, default=0)
+    parser.add_argument("--accounts", type=int, default=200)
+    args = parser.parse_args()
+    # Retry dropped sessions straight away and don't stagger refreshes.
+    api_module.RETRY_BASE_DELAY = 0
+    group_module.JITTER = 0
+    has_ha = importlib.util.find_spec("pytest_homeassistant_custom_component")
+
+    columns = (
+        ("users", "{:>8}"),
+        ("full_scan_s", "{:>11.3f}"),
+        ("parse_records_s", "{:>15,.0f}"),
+        ("refresh_p50_s", "{:>13.4f}"),
+        ("refresh_max_s", "{:>13.4f}"),
+        ("scan_block_ms", "{:>13.1f}"),
+        ("refresh_block_ms", "{:>16.1f}"),
+        ("peak_mib", "{:>8.1f}"),
+        ("writes", "{:>8.0f}"),
+        ("writes_all", "{:>10.0f}"),
+        ("failed_accounts", "{:>15}"),
+    )
+    header = [name.rjust(len(fmt.format(0))) for name, fmt in columns]
+    print(" ".join(header))
+    for users in args.users:
+        results = asyncio.run(bench(users, args))
+        results["users"] = users
+        if has_ha:
+            results.update(asyncio.run(bench_entities(users, args)))
+        else:
+            results["writes"] = results["writes_all"] = float("nan")
+        print(" ".join(fmt.format(results[name]) for name, fmt in columns))
+    if not has_ha:
+        print("writes: skipped, needs pytest-homeassistant-custom-component")
+
+
+if __name__ == "__main__":
+    main()
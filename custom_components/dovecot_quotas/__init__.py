@@ -2,18 +2,83 @@
 
 from __future__ import annotations
 
+from collections.abc import Mapping
+from typing import Any
+
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import Event, HomeAssistant
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.importlib import async_import_module
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.typing import ConfigType
 
 from .api import QuotasAPI
 from .const import (
     DOMAIN,
     PLATFORMS,
+    BACKEND_HTTP,
+    BACKEND_SSH,
+    CONF_BACKEND,
     CONF_HOSTNAME,
     CONF_USERNAME,
     CONF_PASSWORD,
+    CONF_PORT,
+    CONF_SSL,
+    CONF_MAX_COMMANDS_PER_MINUTE,
+    DATA_GROUP,
+    DEFAULT_HTTP_PORT,
+    DEFAULT_MAX_COMMANDS_PER_MINUTE,
+    DEFAULT_MAX_CONCURRENT_REFRESHES,
+    DEFAULT_SSH_PORT,
+    SNAPSHOT_STORAGE_KEY,
+    STAGGER_WINDOW,
+    STORAGE_KEY,
+    STORAGE_VERSION,
 )
 from .coordinator import DovecotQuotasUpdateCoordinator
+from .group import RefreshGroup
+from .http_api import HTTPQuotasAPI
+from .services import async_setup_services
+
+CONFIG_SCHEMA = cv.config_entry_only_config_schema(DOMAIN)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    """Set up the Dovecot quotas integration."""
+    async_setup_services(hass)
+    return True
+
+
+async def async_create_api(
+    hass: HomeAssistant,
+    data: Mapping[str, Any],
+    max_commands_per_minute: int | None = None,
+) -> QuotasAPI:
+    """Create the API for the backend chosen in the config flow.
+
+    The SSH backend pulls in paramiko and cryptography, so it is only
+    imported, in the executor, once an SSH entry is set up.
+    """
+    if data.get(CONF_BACKEND, BACKEND_SSH) == BACKEND_HTTP:
+        return HTTPQuotasAPI(
+            async_get_clientsession(hass),
+            hostname=data[CONF_HOSTNAME],
+            port=data.get(CONF_PORT, DEFAULT_HTTP_PORT),
+            username=data[CONF_USERNAME],
+            password=data[CONF_PASSWORD],
+            ssl=data.get(CONF_SSL, False),
+            max_commands_per_minute=max_commands_per_minute,
+        )
+    ssh_api = await async_import_module(hass, f"{__package__}.ssh_api")
+    return ssh_api.SSHQuotasAPI(
+        hostname=data[CONF_HOSTNAME],
+        username=data[CONF_USERNAME],
+        password=data[CONF_PASSWORD],
+        port=data.get(CONF_PORT, DEFAULT_SSH_PORT),
+        max_commands_per_minute=max_commands_per_minute,
+    )
 
 
 async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
@@ -21,21 +86,50 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     if hass.data.get(DOMAIN) is None:
         hass.data.setdefault(DOMAIN, {})
 
-    hostname = config_entry.data[CONF_HOSTNAME]
-    username = config_entry.data[CONF_USERNAME]
-    password = config_entry.data[CONF_PASSWORD]
-
-    api = QuotasAPI(
-        hostname=hostname,
-        username=username,
-        password=password,
+    api = await async_create_api(
+        hass,
+        config_entry.data,
+        config_entry.options.get(
+            CONF_MAX_COMMANDS_PER_MINUTE, DEFAULT_MAX_COMMANDS_PER_MINUTE
+        ),
     )
 
+    if (group := hass.data.get(DATA_GROUP)) is None:
+        group = hass.data[DATA_GROUP] = RefreshGroup(
+            DEFAULT_MAX_CONCURRENT_REFRESHES, STAGGER_WINDOW
+        )
+    group.register(config_entry.entry_id)
+
     hass.data[DOMAIN][config_entry.entry_id] = coordinator = (
-        DovecotQuotasUpdateCoordinator(hass, api=api, config_entry=config_entry)
+        DovecotQuotasUpdateCoordinator(
+            hass, api=api, config_entry=config_entry, group=group
+        )
     )
 
-    await coordinator.async_config_entry_first_refresh()
+    await coordinator.async_load()
+    if await coordinator.async_restore():
+        # Entities start from the saved snapshot; fetch fresh data meanwhile.
+        config_entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN} initial refresh"
+        )
+    else:
+        try:
+            await coordinator.async_config_entry_first_refresh()
+        except Exception:
+            # Setup is retried with a new API; don't leave this one behind.
+            hass.data[DOMAIN].pop(config_entry.entry_id, None)
+            group.unregister(config_entry.entry_id)
+            await api.close()
+            raise
+    coordinator.async_start_watcher()
+
+    async def async_close(event: Event) -> None:
+        """Close the connection, ending the watcher, when Home Assistant stops."""
+        await api.close()
+
+    config_entry.async_on_unload(
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close)
+    )
 
     await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
     config_entry.async_on_unload(config_entry.add_update_listener(async_reload_entry))
@@ -45,9 +139,26 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
 
 async def async_unload_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    return await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
+    unload_ok = await hass.config_entries.async_unload_platforms(
+        config_entry, PLATFORMS
+    )
+    if unload_ok:
+        coordinator: DovecotQuotasUpdateCoordinator = hass.data[DOMAIN].pop(
+            config_entry.entry_id
+        )
+        await coordinator.api.close()
+        hass.data[DATA_GROUP].unregister(config_entry.entry_id)
+    return unload_ok
 
 
 async def async_reload_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
     """Reload config entry."""
     await hass.config_entries.async_reload(config_entry.entry_id)
+
+
+async def async_remove_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
+    """Remove the data stored for a config entry."""
+    for key in (STORAGE_KEY, SNAPSHOT_STORAGE_KEY):
+        await Store(
+            hass, STORAGE_VERSION, key.format(entry_id=config_entry.entry_id)
+        ).async_remove()
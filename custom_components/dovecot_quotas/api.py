@@ -1,100 +1,259 @@
 """Dovecot Quotas API"""
 
-import re
+from abc import ABC, abstractmethod
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass
 import logging
-import socket
-import paramiko
+import re
 
-TIMEOUT = 10
+from .scheduler import CircuitBreaker, RateLimiter, backoff_delay
+from .snapshot import QuotaSnapshot
+from .timing import PhaseTimings
 
-GET_QUOTA_CMD = "doveadm quota get -A | grep STORAGE"
-GET_DOVECOT_VERSION_CMD = "doveadm --version"
+# Number of users passed to a single targeted quota query.
+QUOTA_CHUNK_SIZE = 500
+# Use the full scan once this share of the server's users is selected.
+FULL_SCAN_RATIO = 0.5
+# Without a known user count, fall back to a full scan from this many users.
+FULL_SCAN_MIN_ACCOUNTS = 2000
+# Chunks handled at once by bulk operations.
+MAX_CONCURRENT_COMMANDS = 4
+# Attempts per quota query within a refresh, with backoff in between.
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1  # seconds
+RETRY_MAX_DELAY = 10  # seconds
+# Consecutive failed queries after which the host isn't contacted for a while.
+BREAKER_THRESHOLD = 5
+BREAKER_BASE_DELAY = 60  # seconds
+BREAKER_MAX_DELAY = 3600  # seconds
+CIRCUIT_OPEN_MESSAGE = "Host recently failed, not contacting it"
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class QuotasAPI:
-    """Class to interact with the Dovecot Quotas API."""
+class TransportError(Exception):
+    """Raised when the server could not be reached or a command failed."""
+
+
+class CannotConnect(TransportError):
+    """Raised when no connection to the server could be made."""
+
+
+class InvalidAuth(Exception):
+    """Raised when the server rejected the credentials."""
+
+
+@dataclass
+class ConnectionStats:
+    """Counters describing how the connection has been used."""
+
+    connects: int = 0
+    reuses: int = 0
+    reconnects: int = 0
+
 
-    _quotas = {}
-    _hostname: str
-    _username: str
-    _password: str
+class QuotasAPI(ABC):
+    """Transport-agnostic access to doveadm.
 
-    def __init__(self, hostname: str, username: str, password: str):
-        self._hostname = hostname
-        self._username = username
-        self._password = password
+    Backends implement the transport: fetching the quotas of some or all
+    users, recalculating quotas, listing users and the version. Chunking,
+    rate limiting and choosing between a full scan and targeted queries are
+    shared.
+    """
 
+    # True if the backend can run a long-lived command for push mode.
+    can_watch = False
+
+    def __init__(self, max_commands_per_minute: int | None = None) -> None:
+        self._total_accounts: int | None = None
+        self._quotas = QuotaSnapshot()
+        self._rate_limiter = (
+            RateLimiter(max_commands_per_minute) if max_commands_per_minute else None
+        )
+        self._timings = PhaseTimings()
+        self._breaker = CircuitBreaker(
+            BREAKER_THRESHOLD, BREAKER_BASE_DELAY, BREAKER_MAX_DELAY
+        )
+        # Outcome of the latest get_quotas call.
+        self.failed_accounts: set[str] = set()
+        self.scan_failed = False
+
+    @property
+    def connection_stats(self) -> ConnectionStats | None:
+        """Return the connect/reuse/reconnect counters, if the backend has them."""
+        return None
+
+    @property
+    def timings(self) -> PhaseTimings:
+        """Return the per-phase timings of the connection."""
+        return self._timings
+
+    @property
+    def circuit_open(self) -> bool:
+        """Return True while the host isn't contacted after repeated failures."""
+        return self._breaker.open
+
+    @property
+    def host_key(self) -> str | None:
+        """Return a fingerprint that changes when the server is replaced."""
+        return None
+
+    @abstractmethod
     async def get_version(self) -> str:
         """Get the version of Dovecot installed on the server."""
-        output = await self.execute_command(GET_DOVECOT_VERSION_CMD)
-        version = re.search(r"(\d+\.\d+\.\d+\.\d+)", output)
-        return version.group() if version else ""
 
-    async def get_quotas(self):
-        """Get the quotas for all mailboxes."""
-        await self.update_quotas()
+    @abstractmethod
+    async def list_accounts(self, mask: str = "*") -> list[str]:
+        """List the users matching a mask without computing their quotas.
+
+        Raises CannotConnect when the users could not be listed.
+        """
+
+    async def get_quotas(self, accounts: list[str] | None = None) -> QuotaSnapshot:
+        """Get the quotas for the given mailboxes, or all when omitted."""
+        await self.update_quotas(accounts)
         return self._quotas
 
-    async def update_quotas(self):
-        """Update the quotas for all mailboxes."""
-        self._quotas = {}
+    def use_full_scan(self, accounts: list[str] | None) -> bool:
+        """Return True if a full scan is cheaper than targeted queries."""
+        if accounts is None:
+            return True
+        if self._total_accounts:
+            return len(accounts) >= self._total_accounts * FULL_SCAN_RATIO
+        return len(accounts) >= FULL_SCAN_MIN_ACCOUNTS
+
+    async def update_quotas(self, accounts: list[str] | None = None):
+        """Update the quotas for the given mailboxes, or all when omitted.
+
+        Accounts that were received are kept when a query fails halfway.
+        The accounts that could not be fetched end up in failed_accounts, or
+        scan_failed is set when a full scan was interrupted.
+        """
+        self._quotas = quotas = QuotaSnapshot()
+        self.failed_accounts = set()
+        self.scan_failed = False
 
-        result = await self.execute_command(GET_QUOTA_CMD)
-        if not result:
-            _LOGGER.error("Failed to execute command: %s", GET_QUOTA_CMD)
+        full_scan = self.use_full_scan(accounts)
+        if full_scan:
+            try:
+                await self._query_quotas(None, quotas)
+            except TransportError as err:
+                _LOGGER.error("Failed to retrieve quotas: %s", err)
+                self.scan_failed = True
+            else:
+                self._total_accounts = len(quotas)
             return
+        if not accounts:
+            return
+        for start in range(0, len(accounts), QUOTA_CHUNK_SIZE):
+            chunk = accounts[start : start + QUOTA_CHUNK_SIZE]
+            try:
+                await self._query_quotas(chunk, quotas)
+            except TransportError as err:
+                _LOGGER.error("Failed to retrieve quotas: %s", err)
+                self.failed_accounts.update(
+                    account for account in chunk if account not in quotas
+                )
+
+    async def _query_quotas(
+        self, accounts: list[str] | None, quotas: QuotaSnapshot
+    ) -> None:
+        """Fetch quotas into a snapshot, retrying with backoff on failures.
+
+        A retry of a targeted query only asks for the accounts that are still
+        missing; a full scan starts over. The account that was being read
+        when a query failed may have lost some of its rows and is dropped.
+        Nothing is sent while the circuit breaker is open.
+        """
+        for attempt in range(RETRY_ATTEMPTS):
+            if self._breaker.open:
+                raise TransportError(CIRCUIT_OPEN_MESSAGE)
+            if self._rate_limiter:
+                await self._rate_limiter.acquire()
+            received = len(quotas)
+            try:
+                await self._fetch_quotas(accounts, quotas)
+            except TransportError as err:
+                self._breaker.failure()
+                if len(quotas) > received:
+                    quotas.remove(list(quotas)[-1:])
+                if attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                if accounts is None:
+                    # Streaming the same rows again would add them twice.
+                    quotas.remove(list(quotas))
+                else:
+                    accounts = [
+                        account for account in accounts if account not in quotas
+                    ]
+                    if not accounts:
+                        return
+                delay = backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+                _LOGGER.debug("Quota query failed (%s), retrying in %.1fs", err, delay)
+                await asyncio.sleep(delay)
+            else:
+                self._breaker.success()
+                return
+
+    @abstractmethod
+    async def _fetch_quotas(
+        self, accounts: list[str] | None, quotas: QuotaSnapshot
+    ) -> None:
+        """Add the quotas of some users, or all when None, to a snapshot.
+
+        Raises TransportError on failure; records received until then stay
+        in the snapshot.
+        """
+
+    async def recalc_quotas(self, accounts: list[str]) -> dict[str, str | None]:
+        """Recalculate the quota of the given users.
 
-        quotas = {}
-        for line in result.splitlines():
-            mailbox, *_, used, quota, _ = re.split(r" {1,}", line)
-            used = float(used)
-            quota = float(quota) if quota != "-" else None
-            percentage_used = (
-                round(float(used) / float(quota) * 100, 1) if quota else None
+        Users are handled in chunks, with at most MAX_CONCURRENT_COMMANDS
+        chunks in flight at once. Returns the error message per user, or None
+        when the recalculation succeeded. Chunks are not sent while the
+        circuit breaker is open.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+        results: dict[str, str | None] = {}
+
+        async def recalc_chunk(chunk: list[str]) -> None:
+            async with semaphore:
+                if self._breaker.open:
+                    results.update(dict.fromkeys(chunk, CIRCUIT_OPEN_MESSAGE))
+                    return
+                if self._rate_limiter:
+                    await self._rate_limiter.acquire()
+                results.update(await self._recalc_quotas(chunk))
+
+        await asyncio.gather(
+            *(
+                recalc_chunk(accounts[start : start + QUOTA_CHUNK_SIZE])
+                for start in range(0, len(accounts), QUOTA_CHUNK_SIZE)
             )
-            free = float(quota) - float(used) if quota else None
-            percentage_free = 100 - percentage_used if percentage_used else None
-            quotas[mailbox] = {
-                "name": mailbox,
-                "used": used,
-                "quota": quota,
-                "percentage_used": percentage_used,
-                "free": free,
-                "percentage_free": percentage_free,
-            }
-        self._quotas = quotas
+        )
+        return results
 
+    @abstractmethod
+    async def _recalc_quotas(self, accounts: list[str]) -> dict[str, str | None]:
+        """Recalculate the quota of a chunk of users."""
+
+    @abstractmethod
     async def test_connection(self):
-        """Test the SSH connection to the server."""
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            self._hostname,
-            username=self._username,
-            password=self._password,
-            timeout=TIMEOUT,
-        )
-        ssh.close()
-
-    async def execute_command(self, command: str) -> str:
-        """Execute a command on the server via SSH."""
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        try:
-            ssh.connect(
-                self._hostname,
-                username=self._username,
-                password=self._password,
-                timeout=TIMEOUT,
-            )
-        except (paramiko.SSHException, socket.timeout) as e:
-            _LOGGER.error("SSH connection failed: %s", e)
-            return ""
-        ssh_stdin, ssh_stdout, ssh_stderr = ssh.exec_command(command)
-        ssh_stdin.close()
-        ssh_stderr.close()
-        output = ssh_stdout.read().decode()
-        ssh.close()
-        return output
+        """Test the connection, raising CannotConnect or InvalidAuth."""
+
+    async def watch(
+        self,
+        command: str,
+        on_line: Callable[[str], None],
+        pattern: re.Pattern[str] | None = None,
+    ) -> None:
+        """Run a long-lived command, calling on_line for every output line.
+
+        When `pattern` is given, only the lines matching it are passed on.
+        Only backends with can_watch set implement this.
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Close the connection."""
@@ -3,7 +3,6 @@
 from __future__ import annotations
 
 import logging
-import socket
 from typing import Any
 
 import voluptuous as vol
@@ -12,34 +11,160 @@ from homeassistant import config_entries
 from homeassistant.config_entries import ConfigFlowResult
 from homeassistant.core import callback
 from homeassistant.helpers import config_validation, device_registry as dr
-import paramiko.ssh_exception
-
-from .const import DOMAIN, CONF_HOSTNAME, CONF_USERNAME, CONF_PASSWORD, CONF_ACCOUNTS
-from .api import QuotasAPI
+from homeassistant.helpers.selector import (
+    SelectSelector,
+    SelectSelectorConfig,
+    SelectSelectorMode,
+)
+
+from . import async_create_api
+from .const import (
+    DOMAIN,
+    BACKENDS,
+    BACKEND_SSH,
+    CONF_BACKEND,
+    CONF_HOSTNAME,
+    CONF_USERNAME,
+    CONF_PASSWORD,
+    CONF_PORT,
+    CONF_SSL,
+    CONF_ACCOUNTS,
+    CONF_VERSION_INTERVAL,
+    CONF_MAX_COMMANDS_PER_MINUTE,
+    CONF_ENTITY_THRESHOLD,
+    CONF_PUSH,
+    CONF_SERVER_TOTALS,
+    CONF_STALE_AGE,
+    CONF_THRESHOLDS,
+    CONF_HYSTERESIS,
+    CONF_WATCH_COMMAND,
+    DEFAULT_VERSION_INTERVAL,
+    DEFAULT_MAX_COMMANDS_PER_MINUTE,
+    DEFAULT_WATCH_COMMAND,
+    DEFAULT_STALE_AGE,
+    DEFAULT_THRESHOLDS,
+    DEFAULT_HYSTERESIS,
+)
+from .api import CannotConnect, InvalidAuth, QuotasAPI
+from .thresholds import parse_thresholds
 
 _LOGGER = logging.getLogger(__name__)
 
+CONNECTION_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_BACKEND, default=BACKEND_SSH): SelectSelector(
+            SelectSelectorConfig(
+                options=BACKENDS,
+                mode=SelectSelectorMode.DROPDOWN,
+                translation_key=CONF_BACKEND,
+            )
+        ),
+        vol.Required(CONF_HOSTNAME): str,
+        vol.Optional(CONF_PORT): config_validation.port,
+        vol.Required(CONF_SSL, default=False): bool,
+        vol.Required(CONF_USERNAME): str,
+        vol.Required(CONF_PASSWORD): str,
+    }
+)
+
+
+async def _async_test_connection(api: QuotasAPI) -> str | None:
+    """Test the connection and return the error key when it failed."""
+    try:
+        await api.test_connection()
+    except CannotConnect:
+        return "cannot_connect"
+    except InvalidAuth:
+        return "invalid_auth"
+    except Exception:  # pylint: disable=broad-except
+        _LOGGER.exception("Unexpected exception")
+        return "unknown"
+    return None
+
 
 class DovecotQuotasOptionsFlowHandler(config_entries.OptionsFlow):
     """Config flow options for Dovecot Quotas."""
 
     def __init__(self) -> None:
         """Initialize Dovecot Quotas options flow."""
+        self._accounts: list[str] | None = None
+
+    async def _async_list_accounts(self) -> list[str]:
+        """List the server's accounts over the entry's open connection."""
+        entry = self.config_entry
+        if coordinator := self.hass.data.get(DOMAIN, {}).get(entry.entry_id):
+            return await coordinator.api.list_accounts()
+        api = await async_create_api(self.hass, entry.data)
+        try:
+            return await api.list_accounts()
+        finally:
+            await api.close()
 
     async def async_step_init(
         self, _: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Manage the Dovecot Quotas options."""
-        return await self.async_step_accounts()
+        return self.async_show_menu(
+            step_id="init", menu_options=["accounts", "settings"]
+        )
+
+    async def async_step_settings(
+        self, user_input: dict[str, Any] | None = None
+    ) -> ConfigFlowResult:
+        """Handle the polling and caching settings."""
+        errors: dict[str, str] = {}
+        if user_input is not None:
+            try:
+                parse_thresholds(user_input[CONF_THRESHOLDS])
+            except ValueError:
+                errors[CONF_THRESHOLDS] = "invalid_thresholds"
+            else:
+                return self.async_create_entry(data=user_input)
+
+        data_schema = vol.Schema(
+            {
+                vol.Required(
+                    CONF_VERSION_INTERVAL, default=DEFAULT_VERSION_INTERVAL
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                vol.Required(
+                    CONF_MAX_COMMANDS_PER_MINUTE,
+                    default=DEFAULT_MAX_COMMANDS_PER_MINUTE,
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                vol.Required(CONF_PUSH, default=False): bool,
+                vol.Required(CONF_WATCH_COMMAND, default=DEFAULT_WATCH_COMMAND): str,
+                vol.Required(CONF_SERVER_TOTALS, default=False): bool,
+                vol.Required(CONF_ENTITY_THRESHOLD, default=0): vol.All(
+                    vol.Coerce(int), vol.Range(min=0, max=100)
+                ),
+                vol.Required(CONF_STALE_AGE, default=DEFAULT_STALE_AGE): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+                vol.Required(CONF_THRESHOLDS, default=DEFAULT_THRESHOLDS): str,
+                vol.Required(CONF_HYSTERESIS, default=DEFAULT_HYSTERESIS): vol.All(
+                    vol.Coerce(float), vol.Range(min=0, max=50)
+                ),
+            }
+        )
+
+        return self.async_show_form(
+            step_id="settings",
+            data_schema=self.add_suggested_values_to_schema(
+                data_schema=data_schema,
+                suggested_values=user_input or self.config_entry.options,
+            ),
+            errors=errors,
+        )
 
     async def async_step_accounts(
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Handle a reconfiguration flow initialized by the user."""
-        errors: dict[str, str] | None = {}
+        errors: dict[str, str] = {}
         entry = self.config_entry
 
-        if user_input is not None:
+        # The selection is only applied when it was made from the server's
+        # accounts; otherwise listing them is tried again.
+        if user_input is not None and self._accounts is not None:
             new_accounts = user_input.get(CONF_ACCOUNTS, [])
             old_accounts = entry.data.get(CONF_ACCOUNTS, [])
             device_registry = dr.async_get(self.hass)
@@ -62,18 +187,17 @@ class DovecotQuotasOptionsFlowHandler(config_entries.OptionsFlow):
             await self.hass.config_entries.async_reload(entry.entry_id)  # type: ignore
             return self.async_abort(reason="changes_successful")
 
-        hostname = entry.data.get(CONF_HOSTNAME, "")
-        username = entry.data.get(CONF_USERNAME, "")
-        password = entry.data.get(CONF_PASSWORD, "")
-        api = QuotasAPI(
-            hostname=hostname,
-            username=username,
-            password=password,
-        )
-        accounts = []
-        quotas = await api.get_quotas()
-        for account in sorted(quotas.keys()):
-            accounts.append(account)
+        # Show the current selection while the server's accounts can't be
+        # listed.
+        accounts = entry.data.get(CONF_ACCOUNTS, [])
+        if self._accounts is None:
+            try:
+                self._accounts = await self._async_list_accounts()
+            except CannotConnect as err:
+                _LOGGER.warning("Failed to list accounts: %s", err)
+                errors["base"] = "cannot_connect"
+        if self._accounts is not None:
+            accounts = self._accounts
 
         data_schema = vol.Schema(
             {vol.Required(CONF_ACCOUNTS): config_validation.multi_select(accounts)}
@@ -98,6 +222,16 @@ class DovecotQuotasConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Initialize the config flow."""
         super().__init__()
         self._config: dict[str, Any] = {}
+        # One SSH session and account list shared by all steps of the flow.
+        self._api: QuotasAPI | None = None
+        self._accounts: list[str] | None = None
+
+    @callback
+    def async_remove(self) -> None:
+        """Close the flow's SSH session when the flow goes away."""
+        if self._api is not None:
+            self.hass.async_create_task(self._api.close())
+            self._api = None
 
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
@@ -109,38 +243,22 @@ class DovecotQuotasConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             await self.async_set_unique_id(user_input[CONF_HOSTNAME])
             self._abort_if_unique_id_configured()
 
-            try:
-                api = QuotasAPI(
-                    hostname=user_input[CONF_HOSTNAME],
-                    username=user_input[CONF_USERNAME],
-                    password=user_input[CONF_PASSWORD],
-                )
-                await api.test_connection()
-            except (socket.gaierror, paramiko.ssh_exception.NoValidConnectionsError):
-                errors["base"] = "cannot_connect"
-            except paramiko.ssh_exception.AuthenticationException:
-                errors["base"] = "invalid_auth"
-            except Exception:  # pylint: disable=broad-except
-                _LOGGER.exception("Unexpected exception")
-                errors["base"] = "unknown"
+            api = await async_create_api(self.hass, user_input)
+            if error := await _async_test_connection(api):
+                errors["base"] = error
+                await api.close()
             else:
-                self._config[CONF_HOSTNAME] = user_input[CONF_HOSTNAME]
-                self._config[CONF_USERNAME] = user_input[CONF_USERNAME]
-                self._config[CONF_PASSWORD] = user_input[CONF_PASSWORD]
+                if self._api is not None:
+                    await self._api.close()
+                self._api = api
+                self._accounts = None
+                self._config.update(user_input)
                 return await self.async_step_accounts()
 
-        data_schema = vol.Schema(
-            {
-                vol.Required(CONF_HOSTNAME): str,
-                vol.Required(CONF_USERNAME): str,
-                vol.Required(CONF_PASSWORD): str,
-            }
-        )
-
         return self.async_show_form(
             step_id="user",
             data_schema=self.add_suggested_values_to_schema(
-                data_schema=data_schema,
+                data_schema=CONNECTION_SCHEMA,
                 suggested_values=user_input or {},
             ),
             errors=errors,
@@ -150,30 +268,34 @@ class DovecotQuotasConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self, user_input: dict[str, Any] | None = None
     ) -> ConfigFlowResult:
         """Handle the accounts step."""
+        errors: dict[str, str] = {}
 
-        if user_input is not None:
+        if user_input is not None and self._accounts is not None:
             # Create all the devices and entities
             selected_accounts = user_input[CONF_ACCOUNTS]
             self._config[CONF_ACCOUNTS] = selected_accounts
+            if self._api is not None:
+                await self._api.close()
+                self._api = None
             return self.async_create_entry(
                 title=self._config[CONF_HOSTNAME], data=self._config
             )
 
-        api = QuotasAPI(
-            hostname=self._config[CONF_HOSTNAME],
-            username=self._config[CONF_USERNAME],
-            password=self._config[CONF_PASSWORD],
-        )
-        accounts = []
-        quotas = await api.get_quotas()
-        for account in sorted(quotas.keys()):
-            accounts.append(account)
+        if self._accounts is None:
+            try:
+                self._accounts = await self._api.list_accounts()  # type: ignore
+            except CannotConnect as err:
+                _LOGGER.warning("Failed to list accounts: %s", err)
+                errors["base"] = "cannot_connect"
+        accounts = self._accounts or []
 
         data_schema = vol.Schema(
             {vol.Required(CONF_ACCOUNTS): config_validation.multi_select(accounts)}
         )
 
-        return self.async_show_form(step_id="accounts", data_schema=data_schema)
+        return self.async_show_form(
+            step_id="accounts", data_schema=data_schema, errors=errors
+        )
 
     async def async_step_reconfigure(
         self, user_input: dict[str, Any] | None = None
@@ -183,40 +305,25 @@ class DovecotQuotasConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         entry = self.hass.config_entries.async_get_entry(self.context["entry_id"])  # type: ignore
 
         if user_input is not None:
-            try:
-                api = QuotasAPI(
-                    hostname=user_input[CONF_HOSTNAME],
-                    username=user_input[CONF_USERNAME],
-                    password=user_input[CONF_PASSWORD],
-                )
-                await api.test_connection()
-            except (socket.gaierror, paramiko.ssh_exception.NoValidConnectionsError):
-                errors["base"] = "cannot_connect"
-            except paramiko.ssh_exception.AuthenticationException:
-                errors["base"] = "invalid_auth"
-            except Exception:  # pylint: disable=broad-except
-                _LOGGER.exception("Unexpected exception")
-                errors["base"] = "unknown"
+            api = await async_create_api(self.hass, user_input)
+            error = await _async_test_connection(api)
+            await api.close()
+            if error:
+                errors["base"] = error
             else:
+                # The port is optional; drop it unless it was entered again.
+                data = {k: v for k, v in entry.data.items() if k != CONF_PORT}  # type: ignore
                 self.hass.config_entries.async_update_entry(
                     entry,  # type: ignore
-                    data=entry.data | user_input,  # type: ignore
+                    data=data | user_input,
                 )
                 await self.hass.config_entries.async_reload(entry.entry_id)  # type: ignore
                 return self.async_abort(reason="reconfigure_successful")
 
-        data_schema = vol.Schema(
-            {
-                vol.Required(CONF_HOSTNAME): str,
-                vol.Required(CONF_USERNAME): str,
-                vol.Required(CONF_PASSWORD): str,
-            }
-        )
-
         return self.async_show_form(
             step_id="reconfigure",
             data_schema=self.add_suggested_values_to_schema(
-                data_schema=data_schema,
+                data_schema=CONNECTION_SCHEMA,
                 suggested_values=entry.data | (user_input or {}),  # type: ignore
             ),
             description_placeholders={"name": entry.title},  # type: ignore
@@ -2,19 +2,62 @@
 
 NAME = "Dovecot Quotas"
 DOMAIN = "dovecot_quotas"
+DATA_GROUP = f"{DOMAIN}_group"
 MODEL = "Quota"
+SERVER_MODEL = "Server"
 MANUFACTURER = "Dovecot"
 
 # Platforms
 SENSOR = "sensor"
 PLATFORMS = [SENSOR]
 
-DEFAULT_SYNC_INTERVAL = 3600  # seconds
+DEFAULT_SYNC_INTERVAL = 3600  # seconds, longest time between polls of an account
+DEFAULT_SCHEDULER_TICK = 300  # seconds, shortest time between polls of an account
+DEFAULT_MAX_COMMANDS_PER_MINUTE = 6
+DEFAULT_RECONCILE_INTERVAL = 21600  # seconds, longest time between polls in push mode
+DEFAULT_WATCH_COMMAND = "tail -n 0 -F /var/log/dovecot.log"
+WATCH_RETRY_DELAY = 60  # seconds
+DEFAULT_MAX_CONCURRENT_REFRESHES = 4
+DEFAULT_STALE_AGE = 24  # hours after which a snapshot is no longer shown
+STAGGER_WINDOW = 60  # seconds over which scheduled refreshes of entries are spread
+DEFAULT_VERSION_INTERVAL = 24  # hours
+DEFAULT_THRESHOLDS = "80, 90, 100"  # percent
+DEFAULT_HYSTERESIS = 2  # percentage points
+
+STORAGE_VERSION = 1
+STORAGE_KEY = f"{DOMAIN}.{{entry_id}}"
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.{{entry_id}}.snapshot"
+STORE_SAVE_DELAY = 10  # seconds
 
 CONF_HOSTNAME = "hostname"
 CONF_USERNAME = "username"
 CONF_PASSWORD = "password"
+CONF_BACKEND = "backend"
+CONF_PORT = "port"
+CONF_SSL = "ssl"
+
+BACKEND_SSH = "ssh"
+BACKEND_HTTP = "http"
+BACKENDS = [BACKEND_SSH, BACKEND_HTTP]
+DEFAULT_HTTP_PORT = 8080
+DEFAULT_SSH_PORT = 22
 
 CONF_ACCOUNTS = "accounts"
 
 CONF_VERSION = "version"
+
+SERVICE_SHOW_ACCOUNTS = "show_accounts"
+SERVICE_RECALCULATE_QUOTAS = "recalculate_quotas"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_MASK = "mask"
+CONF_VERSION_INTERVAL = "version_interval"
+CONF_MAX_COMMANDS_PER_MINUTE = "max_commands_per_minute"
+CONF_PUSH = "push"
+CONF_WATCH_COMMAND = "watch_command"
+CONF_SERVER_TOTALS = "server_totals"
+CONF_ENTITY_THRESHOLD = "entity_threshold"
+CONF_STALE_AGE = "stale_age"
+CONF_THRESHOLDS = "thresholds"
+CONF_HYSTERESIS = "hysteresis"
+
+EVENT_THRESHOLD_CROSSED = f"{DOMAIN}_threshold_crossed"
@@ -1,16 +1,59 @@
 """Coordinator for Dovecot Quotas integration."""
 
+import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import logging
+import re
+import time
+from typing import Any
 from homeassistant import config_entries
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import UpdateFailed, DataUpdateCoordinator
-from homeassistant.core import HomeAssistant
-from .api import QuotasAPI
-from .const import DEFAULT_SYNC_INTERVAL, DOMAIN, CONF_ACCOUNTS, CONF_VERSION
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_call_later
+from homeassistant.util import dt as dt_util
+from .api import QuotasAPI, TransportError
+from .group import RefreshGroup
+from .history import HISTORY_KEYS, UsageHistory
+from .scheduler import AccountScheduler
+from .snapshot import QuotaSnapshot
+from .thresholds import Crossing, ThresholdMonitor, parse_thresholds
+from .totals import ServerTotals
+from .const import (
+    DEFAULT_RECONCILE_INTERVAL,
+    DEFAULT_SCHEDULER_TICK,
+    DEFAULT_HYSTERESIS,
+    DEFAULT_STALE_AGE,
+    DEFAULT_SYNC_INTERVAL,
+    DEFAULT_THRESHOLDS,
+    DEFAULT_VERSION_INTERVAL,
+    DEFAULT_WATCH_COMMAND,
+    DOMAIN,
+    EVENT_THRESHOLD_CROSSED,
+    CONF_ACCOUNTS,
+    CONF_ENTITY_THRESHOLD,
+    CONF_HYSTERESIS,
+    CONF_PUSH,
+    CONF_SERVER_TOTALS,
+    CONF_STALE_AGE,
+    CONF_THRESHOLDS,
+    CONF_VERSION,
+    CONF_VERSION_INTERVAL,
+    CONF_WATCH_COMMAND,
+    SNAPSHOT_STORAGE_KEY,
+    STORAGE_KEY,
+    STORAGE_VERSION,
+    STORE_SAVE_DELAY,
+    WATCH_RETRY_DELAY,
+)
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
+# Dovecot log lines look like "dovecot: lmtp(user@example.com)<pid><id>: ...".
+QUOTA_EVENT_RE = re.compile(r"\((?P<user>[^()\s]+)\)[^:]*:.*quota", re.IGNORECASE)
+
 
 class DovecotQuotasUpdateCoordinator(DataUpdateCoordinator):
     """Class to manage fetching data from the API."""
@@ -20,31 +63,467 @@ class DovecotQuotasUpdateCoordinator(DataUpdateCoordinator):
         hass: HomeAssistant,
         api: QuotasAPI,
         config_entry: config_entries.ConfigEntry,
+        group: RefreshGroup | None = None,
     ) -> None:
         """Initialize."""
         self.api = api
+        self._group = group
+        # Set when accounts were requested outside the regular schedule.
+        self._requested = False
         self.platforms: list[str] = []
         self.last_updated = None
         self._hass = hass
+        # Keys whose value changed per account in the latest refresh.
+        self.changes: dict[str, frozenset[str]] = {}
+        self.skipped_writes = 0
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY.format(entry_id=config_entry.entry_id)
+        )
+        self._snapshot_store: Store[dict[str, Any]] = Store(
+            hass,
+            STORAGE_VERSION,
+            SNAPSHOT_STORAGE_KEY.format(entry_id=config_entry.entry_id),
+        )
+        self._snapshot_saved = 0.0
+        self._stale_age = timedelta(
+            hours=config_entry.options.get(CONF_STALE_AGE, DEFAULT_STALE_AGE)
+        )
+        # Makes the entities unavailable once the data is older than that.
+        self._unsub_stale: CALLBACK_TYPE | None = None
+        # Cached 'doveadm --version' result: version, host_key and fetched.
+        self._version: dict[str, Any] = {}
+        # Accounts that got entities on request or by reaching the threshold.
+        self.materialized: set[str] = set()
+        self._entity_threshold = config_entry.options.get(CONF_ENTITY_THRESHOLD, 0)
+        self._version_checked = False
+        self._push = config_entry.options.get(CONF_PUSH, False)
+        if self._push and not api.can_watch:
+            _LOGGER.warning("Push mode needs the SSH backend, polling instead")
+            self._push = False
+        self._server_totals = config_entry.options.get(CONF_SERVER_TOTALS, False)
+        self._next_full_scan = 0.0
+        self.totals = ServerTotals()
+        try:
+            thresholds = parse_thresholds(
+                config_entry.options.get(CONF_THRESHOLDS, DEFAULT_THRESHOLDS)
+            )
+        except ValueError as err:
+            _LOGGER.warning("Ignoring invalid usage thresholds: %s", err)
+            thresholds = []
+        self.thresholds = ThresholdMonitor(
+            thresholds, config_entry.options.get(CONF_HYSTERESIS, DEFAULT_HYSTERESIS)
+        )
+        self.history = UsageHistory()
+        # Forecast of the accounts sampled in the latest refresh, from before
+        # their new sample.
+        self._forecasts: dict[str, dict[str, float | None]] = {}
+        # Time the latest refresh spent waiting for its slot in the group.
+        self._waited = 0.0
+        # Quota roots that were dropped because an account has several, per
+        # account; each root is logged once.
+        self.ignored_roots: dict[str, set[str]] = {}
+        self._logged_roots: set[str] = set()
+        # In push mode polling is only a slow reconciliation pass.
+        self.scheduler = AccountScheduler(
+            DEFAULT_SCHEDULER_TICK,
+            DEFAULT_RECONCILE_INTERVAL if self._push else DEFAULT_SYNC_INTERVAL,
+            self.history,
+        )
 
         super().__init__(
             hass,
             _LOGGER,
             name=DOMAIN,
-            update_interval=timedelta(seconds=DEFAULT_SYNC_INTERVAL),
+            update_interval=timedelta(seconds=DEFAULT_SCHEDULER_TICK),
             config_entry=config_entry,
         )
 
     async def _async_update_data(self):
         """Update data via library."""
+        timings = self.api.timings
         try:
+            start = time.perf_counter()
             data = {}
-            data[CONF_ACCOUNTS] = await self.api.get_quotas()
-            data[CONF_VERSION] = await self.api.get_version()
+            quotas, previous, changes = await self._async_update_quotas()
+            data[CONF_ACCOUNTS] = quotas
+            self.totals.update(quotas, previous, changes)
+            self._async_fire_crossings(self.thresholds.update(quotas, changes))
+            # A new sample may move the forecast even if usage is unchanged.
+            self.changes = dict(changes)
+            for account, before in self._forecasts.items():
+                after = self.forecast(account, quotas)
+                if keys := {key for key in HISTORY_KEYS if after[key] != before[key]}:
+                    self.changes[account] = (
+                        self.changes.get(account, frozenset()) | keys
+                    )
+            data[CONF_VERSION] = await self._async_get_version()
+            if stats := self.api.connection_stats:
+                _LOGGER.debug("Connection stats: %s", stats)
             self.last_updated = datetime.now().replace(
                 tzinfo=ZoneInfo(self._hass.config.time_zone)
             )
+            # The stagger delay and the wait for a slot are recorded as "wait".
+            timings.record("refresh", time.perf_counter() - start - self._waited)
+            self._async_schedule_stale()
+            self._async_save_snapshot(quotas, bool(changes))
             return data
         except Exception as exception:
             _LOGGER.error("Error _async_update_data: %s", exception)
             raise UpdateFailed() from exception
+
+    @callback
+    def _async_fire_crossings(self, crossings: list[Crossing]) -> None:
+        """Fire an event for every account that crossed a usage threshold."""
+        for crossing in crossings:
+            self.hass.bus.async_fire(
+                EVENT_THRESHOLD_CROSSED,
+                {"config_entry_id": self.config_entry.entry_id, **crossing._asdict()},
+            )
+
+    async def _async_update_quotas(
+        self,
+    ) -> tuple[QuotaSnapshot, QuotaSnapshot | None, dict[str, frozenset[str]]]:
+        """Fetch the accounts that are due in one targeted call.
+
+        With server totals enabled, every DEFAULT_SYNC_INTERVAL all accounts
+        on the server are fetched instead. Targeted results are merged into
+        the current snapshot in place. Returns the snapshot, the previous
+        values of the changed accounts and the changed keys per account.
+        """
+        previous: QuotaSnapshot | None = self.data[CONF_ACCOUNTS] if self.data else None
+        now = time.time()
+        selected = self.config_entry.data.get(CONF_ACCOUNTS, [])
+        due = self.scheduler.due(selected, now)
+        full_scan = self._server_totals and now >= self._next_full_scan
+        self._forecasts = {}
+        self._waited = 0.0
+        if not due and not full_scan and previous is not None:
+            return previous, previous, {}
+
+        accounts = None if full_scan else due
+        requested, self._requested = self._requested, False
+        if self._group is None:
+            fetched = await self.api.get_quotas(accounts)
+        else:
+            start = time.perf_counter()
+            if previous is not None and not requested:
+                await asyncio.sleep(self._group.delay(self.config_entry.entry_id))
+            async with self._group.semaphore:
+                self._waited = time.perf_counter() - start
+                self.api.timings.record("wait", self._waited)
+                fetched = await self.api.get_quotas(accounts)
+        if (full_scan or due) and not len(fetched):
+            if self.api.circuit_open:
+                raise UpdateFailed("Server failed repeatedly, backing off")
+            raise UpdateFailed("No quotas received")
+        if self.api.scan_failed:
+            # Keep what the interrupted scan returned and scan again next tick.
+            full_scan = False
+            polled = [account for account in selected if account in fetched]
+        else:
+            if full_scan:
+                self._next_full_scan = now + DEFAULT_SYNC_INTERVAL
+                due = selected
+            # Failed accounts stay due, so the next tick only retries those.
+            failed = self.api.failed_accounts
+            polled = [account for account in due if account not in failed]
+        self._forecasts = {
+            account: self.forecast(account, previous) for account in polled
+        }
+        self.scheduler.update(polled, fetched, now)
+        self._note_ignored_roots(fetched)
+        _LOGGER.debug("Polled %d of %d due accounts", len(polled), len(due))
+
+        with self.api.timings.measure("diff"):
+            if full_scan:
+                return fetched, previous, fetched.diff(previous)
+            # The API may answer a large targeted request with a full scan;
+            # only keep the requested accounts unless the totals cover the
+            # server.
+            accounts = None if self._server_totals else due
+            if previous is None:
+                quotas = QuotaSnapshot()
+                quotas.update(fetched, accounts)
+                return quotas, None, quotas.diff(None)
+            changed, changes = previous.merge(fetched, accounts)
+            return previous, changed, changes
+
+    def _note_ignored_roots(self, fetched: QuotaSnapshot) -> None:
+        """Remember and log the quota roots that were left out of a snapshot."""
+        for account in [
+            account
+            for account in self.ignored_roots
+            if account in fetched and account not in fetched.ignored_roots
+        ]:
+            del self.ignored_roots[account]
+        for account, roots in fetched.ignored_roots.items():
+            self.ignored_roots[account] = roots
+            if new := roots - self._logged_roots:
+                self._logged_roots |= new
+                _LOGGER.warning(
+                    "%s has more than one quota root; only the first is used, "
+                    "ignoring %s",
+                    account,
+                    ", ".join(sorted(new)),
+                )
+
+    @callback
+    def async_start_watcher(self) -> None:
+        """Start following quota events on the server when push mode is on."""
+        if self._push:
+            self.config_entry.async_create_background_task(
+                self.hass, self._async_watch(), f"{DOMAIN} quota watcher"
+            )
+
+    async def _async_watch(self) -> None:
+        """Keep the remote watcher running, restarting it when it stops."""
+        command = self.config_entry.options.get(
+            CONF_WATCH_COMMAND, DEFAULT_WATCH_COMMAND
+        )
+        while True:
+            try:
+                await self.api.watch(command, self._handle_watch_line, QUOTA_EVENT_RE)
+            except Exception as exception:
+                if self.hass.is_stopping:
+                    return
+                _LOGGER.warning("Quota watcher failed: %s", exception)
+            else:
+                if self.hass.is_stopping:
+                    return
+                _LOGGER.warning("Quota watcher exited, restarting")
+            await asyncio.sleep(WATCH_RETRY_DELAY)
+
+    @callback
+    def _handle_watch_line(self, line: str) -> None:
+        """Refresh the account a quota event was logged for."""
+        if (match := QUOTA_EVENT_RE.search(line)) is None:
+            return
+        account = match.group("user")
+        if account not in self.config_entry.data.get(CONF_ACCOUNTS, []):
+            return
+        _LOGGER.debug("Quota event for %s", account)
+        self.scheduler.poll_now([account])
+        self._requested = True
+        self.hass.async_create_task(self.async_request_refresh())
+
+    async def async_recalculate_quotas(
+        self, accounts: list[str] | None = None, mask: str | None = None
+    ) -> dict[str, str | None]:
+        """Recalculate quotas on the server and refresh the affected accounts.
+
+        Only the selected accounts among them are polled again, in a targeted
+        refresh instead of a full scan. Raises HomeAssistantError when the
+        users matching the mask could not be listed.
+        """
+        if accounts is None:
+            try:
+                accounts = await self.api.list_accounts(mask or "*")
+            except TransportError as err:
+                raise HomeAssistantError(f"Failed to list accounts: {err}") from err
+        results = await self.api.recalc_quotas(accounts)
+        selected = set(self.config_entry.data.get(CONF_ACCOUNTS, []))
+        if affected := [
+            account
+            for account, error in results.items()
+            if error is None and account in selected
+        ]:
+            self.scheduler.poll_now(affected)
+            self._requested = True
+            await self.async_request_refresh()
+        return results
+
+    @property
+    def version(self) -> str | None:
+        """Return the cached Dovecot version."""
+        return self._version.get(CONF_VERSION)
+
+    async def async_load(self) -> None:
+        """Load the persisted Dovecot version and materialised accounts."""
+        stored = await self._store.async_load() or {}
+        self._version = stored.get("version", {})
+        self.materialized = set(stored.get("materialized", []))
+
+    @callback
+    def _async_save(self) -> None:
+        """Persist the Dovecot version and materialised accounts."""
+        self._store.async_delay_save(
+            lambda: {
+                "version": self._version,
+                "materialized": sorted(self.materialized),
+            },
+            STORE_SAVE_DELAY,
+        )
+
+    async def async_restore(self) -> bool:
+        """Show the last saved snapshot until the first refresh finishes."""
+        if not (stored := await self._snapshot_store.async_load()):
+            return False
+        try:
+            quotas = QuotaSnapshot.from_dict(stored["quotas"])
+            last_updated = datetime.fromisoformat(stored["last_updated"])
+        except (KeyError, TypeError, ValueError) as exception:
+            _LOGGER.warning("Ignoring saved snapshot: %s", exception)
+            return False
+        if not self._server_totals:
+            # Accounts may have been deselected since the snapshot was saved.
+            selected = set(self.config_entry.data.get(CONF_ACCOUNTS, []))
+            quotas.remove([account for account in quotas if account not in selected])
+        self.changes = quotas.diff(None)
+        self.totals.update(quotas, None, self.changes)
+        self.thresholds.update(quotas, self.changes)
+        self.last_updated = last_updated
+        self._async_schedule_stale()
+        # The refresh that follows is the first one at setup; don't stagger it.
+        self._requested = True
+        self.async_set_updated_data(
+            {CONF_ACCOUNTS: quotas, CONF_VERSION: self.version or ""}
+        )
+        return True
+
+    @callback
+    def _async_schedule_stale(self) -> None:
+        """Update the entities once the latest data goes stale."""
+        if self._unsub_stale is not None:
+            self._unsub_stale()
+        delay = self.last_updated + self._stale_age - dt_util.now()  # type: ignore
+        self._unsub_stale = async_call_later(
+            self.hass, max(delay.total_seconds(), 0), self._async_handle_stale
+        )
+
+    @callback
+    def _async_handle_stale(self, _: datetime) -> None:
+        """Make the entities unavailable while no refresh succeeds."""
+        self._unsub_stale = None
+        # Only the availability changed, not the data.
+        self.changes = {}
+        self.async_update_listeners()
+
+    async def async_shutdown(self) -> None:
+        """Cancel the stale timer and shut down the coordinator."""
+        if self._unsub_stale is not None:
+            self._unsub_stale()
+            self._unsub_stale = None
+        await super().async_shutdown()
+
+    @callback
+    def _async_save_snapshot(self, quotas: QuotaSnapshot, changed: bool) -> None:
+        """Persist the latest snapshot when it changed, or at least hourly."""
+        now = time.time()
+        if not changed and now - self._snapshot_saved < DEFAULT_SYNC_INTERVAL:
+            return
+        self._snapshot_saved = now
+        last_updated = self.last_updated
+        self._snapshot_store.async_delay_save(
+            lambda: {
+                "last_updated": last_updated.isoformat(),  # type: ignore
+                "quotas": quotas.as_dict(),
+            },
+            STORE_SAVE_DELAY,
+        )
+
+    def forecast(
+        self, account: str, quotas: QuotaSnapshot | None = None
+    ) -> dict[str, float | None]:
+        """Return the growth rate and time to full of an account, as shown.
+
+        The time to full is based on the free space in `quotas`, by default
+        the current data.
+        """
+        if quotas is None and self.data:
+            quotas = self.data[CONF_ACCOUNTS]
+        rate = self.history.growth_rate(account)
+        days = self.history.time_to_full(
+            account, quotas.get(account, "free") if quotas is not None else None
+        )
+        return {
+            "growth_rate": round(rate, 1) if rate is not None else None,
+            "time_to_full": round(days, 1) if days is not None else None,
+        }
+
+    @property
+    def data_available(self) -> bool:
+        """Return True if the data is recent enough to be shown.
+
+        Failed refreshes don't make entities unavailable until the data is
+        older than the configured stale age.
+        """
+        if self.data is None or self.last_updated is None:
+            return False
+        return dt_util.now() - self.last_updated <= self._stale_age
+
+    @callback
+    def async_active_accounts(self) -> set[str]:
+        """Return the selected accounts that should have entities.
+
+        Without an entity threshold every selected account is active. With
+        one, only accounts that were requested through the service or
+        reached the threshold at some point get entities.
+        """
+        selected = self.config_entry.data.get(CONF_ACCOUNTS, [])
+        if not self._entity_threshold:
+            return set(selected)
+        if self.data and self.changes:
+            quotas = self.data[CONF_ACCOUNTS]
+            crossed = {
+                account
+                for account in self.changes
+                if account not in self.materialized
+                and (percentage := quotas.get(account, "percentage_used")) is not None
+                and percentage >= self._entity_threshold
+            }
+            if crossed:
+                self.materialized |= crossed
+                self._async_save()
+        return self.materialized.intersection(selected)
+
+    @callback
+    def async_materialize(self, accounts: list[str]) -> None:
+        """Create entities for accounts on request."""
+        if new := set(accounts) - self.materialized:
+            self.materialized |= new
+            self._async_save()
+            # Nothing changed in the data itself, only the set of entities.
+            self.changes = {}
+            self.async_update_listeners()
+
+    async def _async_get_version(self) -> str:
+        """Return the Dovecot version, only asking the server when needed.
+
+        The version is fetched once after startup, when the server presents a
+        different host key and when the configured interval has passed.
+        """
+        interval = (
+            self.config_entry.options.get(
+                CONF_VERSION_INTERVAL, DEFAULT_VERSION_INTERVAL
+            )
+            * 3600
+        )
+        if (
+            self._version_checked
+            and self._version.get("host_key") == self.api.host_key
+            and time.time() - self._version.get("fetched", 0) < interval
+        ):
+            return self._version[CONF_VERSION]
+
+        if not (version := await self.api.get_version()):
+            return self._version.get(CONF_VERSION, "")
+        self._version = {
+            CONF_VERSION: version,
+            "host_key": self.api.host_key,
+            "fetched": time.time(),
+        }
+        self._version_checked = True
+        self._async_save()
+        return self._version[CONF_VERSION]
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all listeners and log how many state writes were skipped."""
+        self.skipped_writes = 0
+        with self.api.timings.measure("entity_writes"):
+            super().async_update_listeners()
+        _LOGGER.debug(
+            "%d changed accounts, %d unchanged state writes skipped",
+            len(self.changes),
+            self.skipped_writes,
+        )
@@ -0,0 +1,46 @@
+"""Diagnostics support for the Dovecot Quotas integration."""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN, CONF_ACCOUNTS, CONF_PASSWORD, CONF_USERNAME
+from .coordinator import DovecotQuotasUpdateCoordinator
+
+TO_REDACT = {CONF_PASSWORD, CONF_USERNAME}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, config_entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator: DovecotQuotasUpdateCoordinator = hass.data[DOMAIN][
+        config_entry.entry_id
+    ]
+    api = coordinator.api
+    quotas = coordinator.data[CONF_ACCOUNTS] if coordinator.data else None
+    return {
+        "entry": {
+            "data": async_redact_data(config_entry.data, TO_REDACT),
+            "options": dict(config_entry.options),
+        },
+        "version": coordinator.version,
+        "accounts_in_snapshot": len(quotas) if quotas is not None else None,
+        "last_updated": coordinator.last_updated,
+        "changed_accounts": len(coordinator.changes),
+        "skipped_writes": coordinator.skipped_writes,
+        "connection": asdict(stats) if (stats := api.connection_stats) else None,
+        "circuit_open": api.circuit_open,
+        "failed_accounts": len(api.failed_accounts),
+        "ignored_roots": sorted(
+            {root for roots in coordinator.ignored_roots.values() for root in roots}
+        ),
+        "accounts_with_ignored_roots": len(coordinator.ignored_roots),
+        "bytes_read": api.timings.bytes_read,
+        "timings_ms": api.timings.summary(),
+    }
@@ -0,0 +1,39 @@
+"""Refresh coordination across all Dovecot Quotas config entries."""
+
+import asyncio
+import random
+
+# Share of an entry's slot that is added as random jitter.
+JITTER = 0.2
+
+
+class RefreshGroup:
+    """Stagger the scheduled refreshes of all entries and bound concurrency.
+
+    Every entry gets its own slot within `window` seconds, so entries that
+    were set up at the same moment do not hit their servers at the same
+    time, and at most `max_concurrent` fetches run at once.
+    """
+
+    def __init__(self, max_concurrent: int, window: float) -> None:
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self._window = window
+        self._entries: list[str] = []
+
+    def register(self, entry_id: str) -> None:
+        """Add an entry to the group."""
+        if entry_id not in self._entries:
+            self._entries.append(entry_id)
+
+    def unregister(self, entry_id: str) -> None:
+        """Remove an entry from the group."""
+        if entry_id in self._entries:
+            self._entries.remove(entry_id)
+
+    def delay(self, entry_id: str) -> float:
+        """Return how long a scheduled refresh of an entry should wait."""
+        if entry_id not in self._entries:
+            return 0
+        spacing = self._window / len(self._entries)
+        slot = self._entries.index(entry_id)
+        return slot * spacing + random.uniform(0, spacing * JITTER)
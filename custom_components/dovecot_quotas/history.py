@@ -0,0 +1,90 @@
+"""Usage history and growth forecasting for the Dovecot Quotas integration."""
+
+from array import array
+
+# Samples kept per account.
+HISTORY_SIZE = 48
+# At least this much time must be covered before a growth rate is reported.
+MIN_SPAN = 3600  # seconds
+SECONDS_PER_DAY = 86400
+
+HISTORY_KEYS = frozenset({"growth_rate", "time_to_full"})
+
+
+class _Ring:
+    """Fixed-size ring of (time, used) samples with running regression sums.
+
+    Times are stored in days relative to the first sample to keep the sums
+    well conditioned. Adding a sample updates the sums in O(1), removing the
+    oldest sample's contribution when the ring is full.
+    """
+
+    __slots__ = ("origin", "times", "used", "start", "count", "st", "su", "stt", "stu")
+
+    def __init__(self, origin: float) -> None:
+        self.origin = origin
+        self.times = array("d", bytes(8 * HISTORY_SIZE))
+        self.used = array("d", bytes(8 * HISTORY_SIZE))
+        self.start = 0
+        self.count = 0
+        self.st = self.su = self.stt = self.stu = 0.0
+
+    def add(self, timestamp: float, used: float) -> None:
+        t = (timestamp - self.origin) / SECONDS_PER_DAY
+        if self.count == HISTORY_SIZE:
+            old_t = self.times[self.start]
+            old_u = self.used[self.start]
+            self.st -= old_t
+            self.su -= old_u
+            self.stt -= old_t * old_t
+            self.stu -= old_t * old_u
+            slot = self.start
+            self.start = (self.start + 1) % HISTORY_SIZE
+        else:
+            slot = (self.start + self.count) % HISTORY_SIZE
+            self.count += 1
+        self.times[slot] = t
+        self.used[slot] = used
+        self.st += t
+        self.su += used
+        self.stt += t * t
+        self.stu += t * used
+
+    def slope(self) -> float | None:
+        """Return the least-squares growth in units per day."""
+        n = self.count
+        if n < 2:
+            return None
+        newest = self.times[(self.start + n - 1) % HISTORY_SIZE]
+        if (newest - self.times[self.start]) * SECONDS_PER_DAY < MIN_SPAN:
+            return None
+        denominator = n * self.stt - self.st * self.st
+        if denominator <= 0:
+            return None
+        return (n * self.stu - self.st * self.su) / denominator
+
+
+class UsageHistory:
+    """Bounded usage history per account with growth rate and time to full."""
+
+    def __init__(self) -> None:
+        self._rings: dict[str, _Ring] = {}
+
+    def add(self, account: str, timestamp: float, used: float) -> None:
+        """Record a usage sample."""
+        ring = self._rings.get(account)
+        if ring is None:
+            ring = self._rings[account] = _Ring(timestamp)
+        ring.add(timestamp, used)
+
+    def growth_rate(self, account: str) -> float | None:
+        """Return the growth in KiB per day."""
+        ring = self._rings.get(account)
+        return ring.slope() if ring is not None else None
+
+    def time_to_full(self, account: str, free: float | None) -> float | None:
+        """Return the estimated number of days until the quota is reached."""
+        rate = self.growth_rate(account)
+        if free is None or rate is None or rate <= 0:
+            return None
+        return max(free, 0) / rate
@@ -0,0 +1,151 @@
+"""Dovecot Quotas API over the doveadm HTTP API."""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+
+import aiohttp
+
+from .api import CannotConnect, InvalidAuth, QuotasAPI, TransportError
+from .parser import parse_quota_rows
+from .snapshot import QuotaSnapshot
+
+DOVEADM_PATH = "/doveadm/v1"
+REQUEST_TIMEOUT = 30  # seconds
+# Tag of the command when a batch holds a single command.
+SINGLE_TAG = "c"
+
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, TypeError, ValueError)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HTTPQuotasAPI(QuotasAPI):
+    """Send doveadm commands to the doveadm HTTP API.
+
+    Requests go through a pooled aiohttp session that keeps the connection
+    alive between refreshes. Per-user commands are batched into a single
+    request, tagged with the user they are for.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        hostname: str,
+        port: int,
+        username: str,
+        password: str,
+        ssl: bool = False,
+        max_commands_per_minute: int | None = None,
+    ) -> None:
+        super().__init__(max_commands_per_minute)
+        self._session = session
+        scheme = "https" if ssl else "http"
+        self._url = f"{scheme}://{hostname}:{port}{DOVEADM_PATH}"
+        self._auth = aiohttp.BasicAuth(username, password)
+        self._timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    async def get_version(self) -> str:
+        """Return an empty version; the HTTP API doesn't report it."""
+        return ""
+
+    async def list_accounts(self, mask: str = "*") -> list[str]:
+        """List the users matching a mask without computing their quotas.
+
+        Raises CannotConnect when the users could not be listed.
+        """
+        try:
+            results = await self._request([["user", {"userMask": [mask]}, SINGLE_TAG]])
+        except REQUEST_ERRORS as e:
+            raise CannotConnect(f"doveadm HTTP request failed: {e}") from e
+        kind, rows = results.get(SINGLE_TAG, ("error", None))
+        if kind != "doveadmResponse":
+            raise CannotConnect(f"Listing users failed: {_error(rows)}")
+        return sorted(
+            {
+                username
+                for row in rows
+                if (username := row.get("username") or next(iter(row.values()), ""))
+            }
+        )
+
+    async def _fetch_quotas(
+        self, accounts: list[str] | None, quotas: QuotaSnapshot
+    ) -> None:
+        """Fetch the quotas of all users, or of some in one batched request.
+
+        Users whose command failed are added to failed_accounts.
+        """
+        if accounts is None:
+            commands = [["quotaGet", {"allUsers": True}, SINGLE_TAG]]
+        else:
+            commands = [["quotaGet", {"user": user}, user] for user in accounts]
+        try:
+            results = await self._request(commands)
+        except REQUEST_ERRORS as e:
+            raise TransportError(f"doveadm HTTP request failed: {e}") from e
+        with self.timings.measure("parse"):
+            for tag, (kind, rows) in results.items():
+                if kind != "doveadmResponse":
+                    if accounts is None:
+                        raise TransportError(f"Quota query failed: {_error(rows)}")
+                    _LOGGER.debug("Quota query for %s failed: %s", tag, rows)
+                    self.failed_accounts.add(tag)
+                    continue
+                self.failed_accounts.discard(tag)
+                username = None if accounts is None else tag
+                for record in parse_quota_rows(rows, username):
+                    quotas.add(record)
+
+    async def _recalc_quotas(self, accounts: list[str]) -> dict[str, str | None]:
+        """Recalculate a chunk of users in one batched request."""
+        try:
+            results = await self._request(
+                [["quotaRecalc", {"user": user}, user] for user in accounts]
+            )
+        except REQUEST_ERRORS as e:
+            _LOGGER.error("doveadm HTTP request failed: %s", e)
+            return dict.fromkeys(accounts, str(e))
+        errors: dict[str, str | None] = {}
+        for user in accounts:
+            kind, payload = results.get(user, ("error", {"type": "noResponse"}))
+            errors[user] = None if kind == "doveadmResponse" else _error(payload)
+        return errors
+
+    async def test_connection(self):
+        """Make sure the API is reachable and accepts the credentials."""
+        try:
+            async with self._session.get(
+                self._url, auth=self._auth, timeout=self._timeout
+            ) as response:
+                if response.status in (401, 403):
+                    raise InvalidAuth
+                response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise CannotConnect(str(e)) from e
+
+    async def _request(self, commands: list[list[Any]]) -> dict[str, tuple[str, Any]]:
+        """Send a batch of commands and return each result by its tag."""
+        timings = self.timings
+        start = time.perf_counter()
+        async with self._session.post(
+            self._url, json=commands, auth=self._auth, timeout=self._timeout
+        ) as response:
+            timings.record("first_byte", time.perf_counter() - start)
+            response.raise_for_status()
+            start = time.perf_counter()
+            content = await response.read()
+            timings.record("transfer", time.perf_counter() - start)
+        timings.bytes_read = len(content)
+        return {tag: (kind, payload) for kind, payload, tag in json.loads(content)}
+
+
+def _error(payload: Any) -> str:
+    """Describe an error result of the doveadm HTTP API."""
+    if isinstance(payload, dict):
+        if "exitCode" in payload:
+            return f"Exit code {payload['exitCode']}"
+        return str(payload.get("type", payload))
+    return str(payload)
@@ -0,0 +1,85 @@
+"""Parser for doveadm quota output."""
+
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+STORAGE = "STORAGE"
+MESSAGE = "MESSAGE"
+
+# Column order of 'doveadm -f tab quota get' when the header is missing.
+DEFAULT_COLUMNS = ("username", "root", "type", "value", "limit")
+
+# Header titles (and field names) mapped to the column they identify.
+HEADER_COLUMNS = {
+    "username": "username",
+    "quota name": "root",
+    "root": "root",
+    "type": "type",
+    "value": "value",
+    "limit": "limit",
+}
+
+
+class QuotaRecord(NamedTuple):
+    """A single row of doveadm quota output."""
+
+    username: str
+    root: str
+    type: str
+    value: float
+    limit: float | None
+
+
+def parse_quota_lines(lines: Iterable[str]) -> Iterator[QuotaRecord]:
+    """Yield a record for every row of 'doveadm -f tab quota get' output.
+
+    The first line is the tab formatter's header; it is used to locate the
+    columns, so usernames and quota roots may contain spaces. Rows that do
+    not parse are skipped.
+    """
+    username = root = type_ = value = limit = -1
+    for line in lines:
+        fields = line.rstrip("\r").split("\t")
+        if username < 0:
+            columns = [HEADER_COLUMNS.get(field.strip().lower()) for field in fields]
+            header = set(columns).issuperset(DEFAULT_COLUMNS)
+            if not header:
+                columns = list(DEFAULT_COLUMNS)
+            username, root, type_, value, limit = (
+                columns.index(column) for column in DEFAULT_COLUMNS
+            )
+            if header:
+                continue
+        try:
+            limit_field = fields[limit]
+            yield QuotaRecord(
+                fields[username],
+                fields[root],
+                fields[type_],
+                float(fields[value]),
+                float(limit_field) if limit_field not in ("", "-") else None,
+            )
+        except (IndexError, ValueError):
+            continue
+
+
+def parse_quota_rows(
+    rows: Iterable[dict[str, str]], username: str | None = None
+) -> Iterator[QuotaRecord]:
+    """Yield a record for every row of a doveadm HTTP API quotaGet response.
+
+    Rows of a single-user query carry no username; `username` is used then.
+    Rows that do not parse are skipped.
+    """
+    for row in rows:
+        try:
+            limit = row.get("limit", "")
+            yield QuotaRecord(
+                row.get("username", username) or "",
+                row["root"],
+                row["type"],
+                float(row["value"]),
+                float(limit) if limit not in ("", "-") else None,
+            )
+        except (KeyError, TypeError, ValueError):
+            continue
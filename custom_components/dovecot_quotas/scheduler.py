@@ -0,0 +1,137 @@
+"""Adaptive per-account polling for the Dovecot Quotas integration."""
+
+import asyncio
+from collections import deque
+import random
+import time
+
+from .history import SECONDS_PER_DAY, UsageHistory
+from .snapshot import QuotaSnapshot
+
+# Poll at least this many times before an account is expected to fill up.
+SAFETY_FACTOR = 4
+
+
+class AccountScheduler:
+    """Work out when each account should be polled next.
+
+    Accounts that grow quickly or are close to their quota are polled more
+    often than `max_interval`, dormant accounts at `max_interval`, but never
+    more often than `min_interval`. Every poll adds a sample to `history`,
+    which provides the growth rate.
+    """
+
+    def __init__(
+        self, min_interval: float, max_interval: float, history: UsageHistory
+    ) -> None:
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._history = history
+        self._next_poll: dict[str, float] = {}
+
+    def due(self, accounts: list[str], now: float) -> list[str]:
+        """Return the accounts whose next poll time has passed."""
+        next_poll = self._next_poll
+        return [account for account in accounts if next_poll.get(account, 0) <= now]
+
+    def poll_now(self, accounts: list[str]) -> None:
+        """Make accounts due on the next refresh."""
+        for account in accounts:
+            self._next_poll[account] = 0
+
+    def next_poll(self, account: str) -> float | None:
+        """Return the next poll time of an account."""
+        return self._next_poll.get(account)
+
+    def update(self, accounts: list[str], quotas: QuotaSnapshot, now: float) -> None:
+        """Schedule the next poll for accounts that were just polled."""
+        for account in accounts:
+            used = quotas.get(account, "used")
+            if used is None:
+                # Not reported by the server; don't ask again every tick.
+                self._next_poll[account] = now + self._max_interval
+                continue
+            self._history.add(account, now, used)
+            self._next_poll[account] = now + self._interval(
+                account, used, quotas.get(account, "quota")
+            )
+
+    def _interval(self, account: str, used: float, quota: float | None) -> float:
+        """Return the poll interval for an account."""
+        interval = self._max_interval
+        if quota:
+            free = max(quota - used, 0)
+            # Below half free, shrink the interval with the remaining space.
+            interval = min(interval, self._max_interval * 2 * free / quota)
+            if (rate := self._history.growth_rate(account)) and rate > 0:
+                seconds_to_full = free / rate * SECONDS_PER_DAY
+                interval = min(interval, seconds_to_full / SAFETY_FACTOR)
+        return max(interval, self._min_interval)
+
+
+class RateLimiter:
+    """Allow at most `limit` calls within any `period` seconds."""
+
+    def __init__(self, limit: int, period: float = 60) -> None:
+        self._limit = limit
+        self._period = period
+        self._calls: deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until another call is allowed."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self._period:
+                    self._calls.popleft()
+                if len(self._calls) < self._limit:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self._period - (now - self._calls[0]))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Return an exponential backoff delay, randomised over its upper half."""
+    delay = min(cap, base * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Stop contacting a host after repeated transport failures.
+
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused without contacting the host. It stays open for an exponentially
+    growing, jittered time; after that a single failure opens it again.
+    """
+
+    def __init__(self, threshold: int, base_delay: float, max_delay: float) -> None:
+        self._threshold = threshold
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+
+    @property
+    def open(self) -> bool:
+        """Return True while calls should be refused."""
+        return time.monotonic() < self._open_until
+
+    def success(self) -> None:
+        """Close the circuit after a successful call."""
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+
+    def failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold."""
+        self._failures += 1
+        if self._failures < self._threshold:
+            return
+        self._open_until = time.monotonic() + backoff_delay(
+            self._trips, self._base_delay, self._max_delay
+        )
+        self._trips += 1
+        # Half-open once the delay has passed: the next failure reopens it.
+        self._failures = self._threshold - 1
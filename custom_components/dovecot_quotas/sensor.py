@@ -1,5 +1,9 @@
 """Sensor setup for our Integration."""
 
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
 from homeassistant.components.sensor import SensorEntity, SensorEntityDescription
 from homeassistant.components.sensor.const import (
     DOMAIN as SENSOR_DOMAIN,
@@ -8,11 +12,13 @@ from homeassistant.components.sensor.const import (
 )
 
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     PERCENTAGE,
+    EntityCategory,
     UnitOfInformation,
+    UnitOfTime,
 )
 from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -20,60 +26,182 @@ from homeassistant.helpers.typing import StateType
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
 from .coordinator import DovecotQuotasUpdateCoordinator
+from .history import HISTORY_KEYS
+from .totals import USAGE_THRESHOLDS
 
 from .const import (
+    CONF_HOSTNAME,
     DOMAIN,
     MODEL,
+    SERVER_MODEL,
     MANUFACTURER,
     CONF_ACCOUNTS,
     CONF_VERSION,
 )
 
 
-def get_sensor_descriptions() -> list[SensorEntityDescription]:
-    descriptions: list[SensorEntityDescription] = [
-        SensorEntityDescription(
-            key="quota",
-            translation_key="quota",
-            device_class=SensorDeviceClass.DATA_SIZE,
-            native_unit_of_measurement=UnitOfInformation.KILOBYTES,
-            suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
-            suggested_display_precision=1,
-        ),
-        SensorEntityDescription(
-            key="used",
-            translation_key="used",
-            state_class=SensorStateClass.MEASUREMENT,
-            device_class=SensorDeviceClass.DATA_SIZE,
-            native_unit_of_measurement=UnitOfInformation.KILOBYTES,
-            suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
-            suggested_display_precision=1,
-        ),
-        SensorEntityDescription(
-            key="percentage_used",
-            translation_key="percentage_used",
-            native_unit_of_measurement=PERCENTAGE,
-            state_class=SensorStateClass.MEASUREMENT,
-        ),
-        SensorEntityDescription(
-            key="free",
-            translation_key="free",
+SENSOR_DESCRIPTIONS: tuple[SensorEntityDescription, ...] = (
+    SensorEntityDescription(
+        key="quota",
+        translation_key="quota",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.KILOBYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        suggested_display_precision=1,
+    ),
+    SensorEntityDescription(
+        key="used",
+        translation_key="used",
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.KILOBYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        suggested_display_precision=1,
+    ),
+    SensorEntityDescription(
+        key="percentage_used",
+        translation_key="percentage_used",
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key="free",
+        translation_key="free",
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.KILOBYTES,
+        suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
+        suggested_display_precision=1,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key="percentage_free",
+        translation_key="percentage_free",
+        native_unit_of_measurement=PERCENTAGE,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
+    SensorEntityDescription(
+        key="growth_rate",
+        translation_key="growth_rate",
+        native_unit_of_measurement="KiB/d",
+        state_class=SensorStateClass.MEASUREMENT,
+        suggested_display_precision=1,
+    ),
+    SensorEntityDescription(
+        key="time_to_full",
+        translation_key="time_to_full",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.DAYS,
+        suggested_display_precision=1,
+    ),
+    SensorEntityDescription(
+        key="messages",
+        translation_key="messages",
+        state_class=SensorStateClass.MEASUREMENT,
+    ),
+    SensorEntityDescription(
+        key="messages_quota",
+        translation_key="messages_quota",
+        entity_registry_enabled_default=False,
+    ),
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class ServerSensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor of the server device."""
+
+    value_fn: Callable[[DovecotQuotasUpdateCoordinator], StateType]
+    attributes_fn: Callable[[DovecotQuotasUpdateCoordinator], dict[str, Any]] | None = (
+        None
+    )
+
+
+def _refresh_duration(
+    coordinator: DovecotQuotasUpdateCoordinator, percentile: str
+) -> StateType:
+    """Return a percentile of the refresh duration, in milliseconds."""
+    return coordinator.api.timings.summary()["refresh"][percentile]
+
+
+def _phase_durations(
+    coordinator: DovecotQuotasUpdateCoordinator, percentile: str
+) -> dict[str, Any]:
+    """Return a percentile of every timed phase, in milliseconds."""
+    timings = coordinator.api.timings
+    attributes: dict[str, Any] = {
+        phase: values[percentile] for phase, values in timings.summary().items()
+    }
+    attributes["bytes_read"] = timings.bytes_read
+    return attributes
+
+
+def _largest_mailbox(coordinator: DovecotQuotasUpdateCoordinator) -> StateType:
+    """Return the name of the largest mailbox."""
+    largest = coordinator.totals.largest
+    return largest[0][0] if largest else None
+
+
+SERVER_SENSOR_DESCRIPTIONS: tuple[ServerSensorEntityDescription, ...] = (
+    ServerSensorEntityDescription(
+        key="total_used",
+        translation_key="total_used",
+        state_class=SensorStateClass.MEASUREMENT,
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.KILOBYTES,
+        suggested_unit_of_measurement=UnitOfInformation.GIGABYTES,
+        suggested_display_precision=1,
+        value_fn=lambda coordinator: coordinator.totals.used,
+    ),
+    ServerSensorEntityDescription(
+        key="total_quota",
+        translation_key="total_quota",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.KILOBYTES,
+        suggested_unit_of_measurement=UnitOfInformation.GIGABYTES,
+        suggested_display_precision=1,
+        value_fn=lambda coordinator: coordinator.totals.quota,
+    ),
+    *(
+        ServerSensorEntityDescription(
+            key=f"accounts_over_{threshold}",
+            translation_key=f"accounts_over_{threshold}",
             state_class=SensorStateClass.MEASUREMENT,
-            device_class=SensorDeviceClass.DATA_SIZE,
-            native_unit_of_measurement=UnitOfInformation.KILOBYTES,
-            suggested_unit_of_measurement=UnitOfInformation.MEGABYTES,
-            suggested_display_precision=1,
-            entity_registry_enabled_default=False,
-        ),
-        SensorEntityDescription(
-            key="percentage_free",
-            translation_key="percentage_free",
-            native_unit_of_measurement=PERCENTAGE,
+            value_fn=lambda coordinator, t=threshold: coordinator.totals.over[t],
+        )
+        for threshold in USAGE_THRESHOLDS
+    ),
+    ServerSensorEntityDescription(
+        key="largest_mailbox",
+        translation_key="largest_mailbox",
+        value_fn=_largest_mailbox,
+        attributes_fn=lambda coordinator: {
+            "mailboxes": [
+                {"name": account, "used": used}
+                for account, used in coordinator.totals.largest
+            ]
+        },
+    ),
+    *(
+        ServerSensorEntityDescription(
+            key=f"refresh_duration_{percentile}",
+            translation_key=f"refresh_duration_{percentile}",
+            device_class=SensorDeviceClass.DURATION,
+            native_unit_of_measurement=UnitOfTime.MILLISECONDS,
             state_class=SensorStateClass.MEASUREMENT,
+            entity_category=EntityCategory.DIAGNOSTIC,
             entity_registry_enabled_default=False,
-        ),
-    ]
-    return descriptions
+            value_fn=lambda coordinator, p=percentile: _refresh_duration(
+                coordinator, p
+            ),
+            attributes_fn=lambda coordinator, p=percentile: _phase_durations(
+                coordinator, p
+            ),
+        )
+        for percentile in ("p50", "p95")
+    ),
+)
 
 
 async def async_setup_entry(
@@ -85,21 +213,42 @@ async def async_setup_entry(
     coordinator: DovecotQuotasUpdateCoordinator = hass.data[DOMAIN][
         config_entry.entry_id
     ]
-    entities: list[AccountSensor] = []
-
-    # Add all sensors described above.
-    for account in config_entry.data.get(CONF_ACCOUNTS, []):
-        for description in get_sensor_descriptions():
-            entities.append(
-                AccountSensor(
-                    coordinator=coordinator,
-                    entry_id=config_entry.entry_id,
-                    description=description,
-                    account=account,
-                )
-            )
+    entities: list[SensorEntity] = [
+        ServerSensor(
+            coordinator=coordinator,
+            config_entry=config_entry,
+            description=description,
+        )
+        for description in SERVER_SENSOR_DESCRIPTIONS
+    ]
+
     async_add_entities(entities)
 
+    # Only accounts that are active get entities; more may become active
+    # after a refresh or a service call.
+    created: set[str] = set()
+
+    @callback
+    def _async_add_account_entities() -> None:
+        if not (new_accounts := coordinator.async_active_accounts() - created):
+            return
+        created.update(new_accounts)
+        async_add_entities(
+            AccountSensor(
+                coordinator=coordinator,
+                entry_id=config_entry.entry_id,
+                description=description,
+                account=account,
+            )
+            for account in sorted(new_accounts)
+            for description in SENSOR_DESCRIPTIONS
+        )
+
+    _async_add_account_entities()
+    config_entry.async_on_unload(
+        coordinator.async_add_listener(_async_add_account_entities)
+    )
+
 
 class AccountSensor(CoordinatorEntity[DovecotQuotasUpdateCoordinator], SensorEntity):
     """Defines a Dovecot Quotas sensor."""
@@ -128,10 +277,74 @@ class AccountSensor(CoordinatorEntity[DovecotQuotasUpdateCoordinator], SensorEnt
             sw_version=version,
         )
         self._account = account
+        self._written_available: bool | None = None
+
+    @property
+    def available(self) -> bool:
+        """Return True while the coordinator's data is not stale."""
+        return self.coordinator.data_available
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only when this sensor's value may have changed."""
+        available = self.available
+        if available == self._written_available and (
+            not available
+            or self.entity_description.key
+            not in self.coordinator.changes.get(self._account, ())
+        ):
+            self.coordinator.skipped_writes += 1
+            return
+        self._written_available = available
+        super()._handle_coordinator_update()
 
     @property
     def native_value(self) -> StateType:  # type: ignore
         """Return the state of the sensor."""
-        accounts = self.coordinator.data.get(CONF_ACCOUNTS, {})
-        quota_info = accounts.get(self._account, None)
-        return quota_info.get(self.entity_description.key, None)
+        key = self.entity_description.key
+        if key in HISTORY_KEYS:
+            return self.coordinator.forecast(self._account)[key]
+        return self.coordinator.data[CONF_ACCOUNTS].get(self._account, key)
+
+
+class ServerSensor(CoordinatorEntity[DovecotQuotasUpdateCoordinator], SensorEntity):
+    """Defines a sensor of the Dovecot server device."""
+
+    _attr_has_entity_name = True
+    entity_description: ServerSensorEntityDescription
+
+    def __init__(
+        self,
+        coordinator: DovecotQuotasUpdateCoordinator,
+        config_entry: ConfigEntry,
+        description: ServerSensorEntityDescription,
+    ) -> None:
+        """Initialize Dovecot server sensor."""
+        super().__init__(coordinator=coordinator)
+        self.entity_description = description
+        self._attr_unique_id = f"{config_entry.entry_id}-{description.key}"
+        self._attr_device_info = DeviceInfo(
+            entry_type=DeviceEntryType.SERVICE,
+            identifiers={(DOMAIN, config_entry.entry_id)},
+            name=config_entry.data[CONF_HOSTNAME],
+            model=SERVER_MODEL,
+            manufacturer=MANUFACTURER,
+            sw_version=coordinator.data.get(CONF_VERSION, None),
+        )
+
+    @property
+    def available(self) -> bool:
+        """Return True while the coordinator's data is not stale."""
+        return self.coordinator.data_available
+
+    @property
+    def native_value(self) -> StateType:  # type: ignore
+        """Return the state of the sensor."""
+        return self.entity_description.value_fn(self.coordinator)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any] | None:
+        """Return the state attributes of the sensor."""
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self.coordinator)
@@ -0,0 +1,86 @@
+"""Services for the Dovecot Quotas integration."""
+
+from __future__ import annotations
+
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import config_validation as cv
+
+from .const import (
+    DOMAIN,
+    ATTR_CONFIG_ENTRY_ID,
+    ATTR_MASK,
+    CONF_ACCOUNTS,
+    SERVICE_RECALCULATE_QUOTAS,
+    SERVICE_SHOW_ACCOUNTS,
+)
+from .coordinator import DovecotQuotasUpdateCoordinator
+
+SHOW_ACCOUNTS_SCHEMA = vol.Schema(
+    {vol.Required(CONF_ACCOUNTS): vol.All(cv.ensure_list, [cv.string])}
+)
+
+RECALCULATE_QUOTAS_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Required(ATTR_CONFIG_ENTRY_ID): cv.string,
+            vol.Exclusive(CONF_ACCOUNTS, "target"): vol.All(
+                cv.ensure_list, [cv.string]
+            ),
+            vol.Exclusive(ATTR_MASK, "target"): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(CONF_ACCOUNTS, ATTR_MASK),
+)
+
+
+@callback
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the Dovecot Quotas services."""
+
+    @callback
+    def async_show_accounts(call: ServiceCall) -> None:
+        """Create entities for accounts that don't have them yet."""
+        coordinator: DovecotQuotasUpdateCoordinator
+        for coordinator in hass.data.get(DOMAIN, {}).values():
+            coordinator.async_materialize(call.data[CONF_ACCOUNTS])
+
+    async def async_recalculate_quotas(call: ServiceCall) -> ServiceResponse:
+        """Recalculate quotas on a server and return the result per account."""
+        entry_id = call.data[ATTR_CONFIG_ENTRY_ID]
+        coordinator: DovecotQuotasUpdateCoordinator | None = hass.data.get(
+            DOMAIN, {}
+        ).get(entry_id)
+        if coordinator is None:
+            raise ServiceValidationError(f"Config entry {entry_id} is not loaded")
+        results = await coordinator.async_recalculate_quotas(
+            call.data.get(CONF_ACCOUNTS), call.data.get(ATTR_MASK)
+        )
+        return {
+            CONF_ACCOUNTS: {
+                account: {"success": error is None, "error": error}
+                for account, error in results.items()
+            }
+        }
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SHOW_ACCOUNTS,
+        async_show_accounts,
+        schema=SHOW_ACCOUNTS_SCHEMA,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_RECALCULATE_QUOTAS,
+        async_recalculate_quotas,
+        schema=RECALCULATE_QUOTAS_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
@@ -0,0 +1,245 @@
+"""Columnar snapshot of the quotas reported by doveadm."""
+
+from array import array
+from collections.abc import Iterable, Iterator
+import math
+from typing import Any
+
+from .parser import MESSAGE, STORAGE, QuotaRecord
+
+_NONE = math.nan
+
+STORAGE_KEYS = frozenset(
+    {"used", "quota", "percentage_used", "free", "percentage_free"}
+)
+ALL_KEYS = STORAGE_KEYS | {"name", "messages", "messages_quota"}
+
+
+def _same(a: float, b: float) -> bool:
+    """Compare two column values, treating NaN as equal to NaN."""
+    return a == b or (a != a and b != b)
+
+
+def _value(value: float) -> float | None:
+    """Convert a stored column value back to an optional float."""
+    return None if math.isnan(value) else value
+
+
+class QuotaSnapshot:
+    """Raw used/limit values for a set of accounts, one row per account.
+
+    Values are kept in array-backed columns with NaN meaning "not reported".
+    Derived values such as percentages are only computed when asked for.
+    """
+
+    __slots__ = (
+        "_index",
+        "_names",
+        "used",
+        "quota",
+        "messages",
+        "messages_quota",
+        "ignored_roots",
+    )
+
+    COLUMNS = ("used", "quota", "messages", "messages_quota")
+
+    def __init__(self) -> None:
+        self._index: dict[str, int] = {}
+        self._names: list[str] = []
+        self.used = array("d")
+        self.quota = array("d")
+        self.messages = array("d")
+        self.messages_quota = array("d")
+        # Quota roots that were dropped because the account already had a
+        # value for their resource, per account.
+        self.ignored_roots: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, account: object) -> bool:
+        return account in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def row(self, account: str) -> int | None:
+        """Return the row index of an account."""
+        return self._index.get(account)
+
+    def _row(self, account: str) -> int:
+        """Return the row of an account, appending an empty one if needed."""
+        row = self._index.get(account)
+        if row is None:
+            row = self._index[account] = len(self._names)
+            self._names.append(account)
+            for column in (self.used, self.quota, self.messages, self.messages_quota):
+                column.append(_NONE)
+        return row
+
+    def add(self, record: QuotaRecord) -> None:
+        """Store a record; only the first quota root per resource is kept.
+
+        The roots of later records for the same resource are collected in
+        ignored_roots.
+        """
+        row = self._row(record.username)
+        limit = _NONE if record.limit is None else record.limit
+        if record.type == STORAGE:
+            if math.isnan(self.used[row]):
+                self.used[row] = record.value
+                self.quota[row] = limit
+                return
+        elif record.type == MESSAGE:
+            if math.isnan(self.messages[row]):
+                self.messages[row] = record.value
+                self.messages_quota[row] = limit
+                return
+        else:
+            return
+        self.ignored_roots.setdefault(record.username, set()).add(record.root)
+
+    def remove(self, accounts: Iterable[str]) -> None:
+        """Delete the rows of the given accounts."""
+        drop = {account for account in accounts if account in self._index}
+        if not drop:
+            return
+        names = [name for name in self._names if name not in drop]
+        rows = [self._index[name] for name in names]
+        for column in self.COLUMNS:
+            values = getattr(self, column)
+            setattr(self, column, array("d", [values[row] for row in rows]))
+        self._names = names
+        self._index = {name: row for row, name in enumerate(names)}
+        for account in drop:
+            self.ignored_roots.pop(account, None)
+
+    def update(
+        self, other: "QuotaSnapshot", accounts: Iterable[str] | None = None
+    ) -> None:
+        """Copy the rows of another snapshot into this one.
+
+        When `accounts` is given, only those accounts are copied.
+        """
+        for account in other._index if accounts is None else accounts:
+            if (row := other._index.get(account)) is None:
+                continue
+            own = self._row(account)
+            self.used[own] = other.used[row]
+            self.quota[own] = other.quota[row]
+            self.messages[own] = other.messages[row]
+            self.messages_quota[own] = other.messages_quota[row]
+
+    def merge(
+        self, other: "QuotaSnapshot", accounts: Iterable[str] | None = None
+    ) -> tuple["QuotaSnapshot", dict[str, frozenset[str]]]:
+        """Copy rows of another snapshot into this one, in place.
+
+        Like update, but only the copied rows are compared, so the cost is
+        proportional to the size of `other`. Returns the previous values of
+        the accounts that changed, as a snapshot, and the keys that changed
+        per account; new accounts report all keys.
+        """
+        previous = QuotaSnapshot()
+        changes: dict[str, frozenset[str]] = {}
+        for account in other._index if accounts is None else accounts:
+            if (row := other._index.get(account)) is None:
+                continue
+            own = self._index.get(account)
+            if own is None:
+                changes[account] = ALL_KEYS
+                own = self._row(account)
+            elif keys := self._changed_keys(own, other, row):
+                changes[account] = keys
+                previous.update(self, (account,))
+            else:
+                continue
+            self.used[own] = other.used[row]
+            self.quota[own] = other.quota[row]
+            self.messages[own] = other.messages[row]
+            self.messages_quota[own] = other.messages_quota[row]
+        return previous, changes
+
+    def get(self, account: str, key: str) -> float | str | None:
+        """Return a raw or derived value for an account."""
+        row = self._index.get(account)
+        if row is None:
+            return None
+        if key == "name":
+            return account
+        if key in ("messages", "messages_quota"):
+            return _value(getattr(self, key)[row])
+        used = _value(self.used[row])
+        quota = _value(self.quota[row])
+        if key == "used":
+            return used
+        if key == "quota":
+            return quota
+        if used is None or not quota:
+            return None
+        percentage_used = round(used / quota * 100, 1)
+        if key == "percentage_used":
+            return percentage_used
+        if key == "free":
+            return quota - used
+        if key == "percentage_free":
+            return 100 - percentage_used if percentage_used else None
+        return None
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a compact, JSON serialisable form with one list per column."""
+        data: dict[str, Any] = {"accounts": self._names}
+        for column in self.COLUMNS:
+            data[column] = [_value(value) for value in getattr(self, column)]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "QuotaSnapshot":
+        """Rebuild a snapshot from the output of as_dict."""
+        snapshot = cls()
+        snapshot._names = list(data["accounts"])
+        snapshot._index = {name: row for row, name in enumerate(snapshot._names)}
+        for column in cls.COLUMNS:
+            values = data[column]
+            if len(values) != len(snapshot._names):
+                raise ValueError(f"Column {column} does not match the accounts")
+            getattr(snapshot, column).extend(
+                _NONE if value is None else value for value in values
+            )
+        return snapshot
+
+    def diff(self, previous: "QuotaSnapshot | None") -> dict[str, frozenset[str]]:
+        """Return the keys whose value changed per account since `previous`.
+
+        Accounts that appeared or disappeared report all keys.
+        """
+        if previous is None:
+            return dict.fromkeys(self._names, ALL_KEYS)
+        changes: dict[str, frozenset[str]] = {}
+        for account, row in self._index.items():
+            old = previous._index.get(account)
+            if old is None:
+                changes[account] = ALL_KEYS
+                continue
+            if keys := previous._changed_keys(old, self, row):
+                changes[account] = keys
+        for account in previous._index.keys() - self._index.keys():
+            changes[account] = ALL_KEYS
+        return changes
+
+    def _changed_keys(
+        self, row: int, other: "QuotaSnapshot", other_row: int
+    ) -> frozenset[str]:
+        """Return the keys whose value differs between two rows."""
+        keys: set[str] = set()
+        if not (
+            _same(self.used[row], other.used[other_row])
+            and _same(self.quota[row], other.quota[other_row])
+        ):
+            keys |= STORAGE_KEYS
+        if not _same(self.messages[row], other.messages[other_row]):
+            keys.add("messages")
+        if not _same(self.messages_quota[row], other.messages_quota[other_row]):
+            keys.add("messages_quota")
+        return frozenset(keys)
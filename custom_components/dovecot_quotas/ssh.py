@@ -0,0 +1,206 @@
+"""Persistent SSH connection for the Dovecot Quotas integration."""
+
+import logging
+import socket
+import threading
+import time
+from collections.abc import Iterator
+
+import paramiko
+
+from .api import ConnectionStats
+from .const import DEFAULT_SSH_PORT
+from .timing import PhaseTimings
+
+TIMEOUT = 10
+READ_CHUNK_SIZE = 65536
+KEEPALIVE_INTERVAL = 60  # seconds
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SSHConnection:
+    """A single authenticated SSH transport shared by all commands.
+
+    Every command runs as its own channel on the same transport, so the key
+    exchange and password authentication are only paid when the transport
+    is (re)established. All methods are blocking and are meant to be called
+    from an executor thread.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        username: str,
+        password: str,
+        port: int = DEFAULT_SSH_PORT,
+    ) -> None:
+        self._hostname = hostname
+        self._port = port
+        self._username = username
+        self._password = password
+        self._client: paramiko.SSHClient | None = None
+        self.timings = PhaseTimings()
+        self._lock = threading.Lock()
+        self.stats = ConnectionStats()
+        self.host_key: str | None = None
+
+    @property
+    def connected(self) -> bool:
+        """Return True if the transport is up."""
+        if self._client is None:
+            return False
+        transport = self._client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def connect(self) -> paramiko.Transport:
+        """Return an active transport, connecting if necessary."""
+        with self._lock:
+            if self.connected:
+                self.stats.reuses += 1
+                return self._client.get_transport()  # type: ignore
+            self._close()
+            if self.stats.connects:
+                _LOGGER.debug("SSH transport to %s lost, reconnecting", self._hostname)
+                self.stats.reconnects += 1
+            with self.timings.measure("connect"):
+                sock = self._open_socket()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                with self.timings.measure("auth"):
+                    client.connect(
+                        self._hostname,
+                        username=self._username,
+                        password=self._password,
+                        timeout=TIMEOUT,
+                        sock=sock,
+                    )
+            except BaseException:
+                client.close()
+                sock.close()
+                raise
+            transport = client.get_transport()
+            transport.set_keepalive(KEEPALIVE_INTERVAL)  # type: ignore
+            self.host_key = transport.get_remote_server_key().get_fingerprint().hex()  # type: ignore
+            self._client = client
+            self.stats.connects += 1
+            return transport  # type: ignore
+
+    def _open_socket(self) -> socket.socket:
+        """Open the TCP connection the transport runs on."""
+        try:
+            return socket.create_connection((self._hostname, self._port), TIMEOUT)
+        except socket.gaierror:
+            raise
+        except OSError as err:
+            raise paramiko.ssh_exception.NoValidConnectionsError(
+                {(self._hostname, self._port): err}
+            ) from err
+
+    def open_channel(self) -> paramiko.Channel:
+        """Open a session channel, reconnecting once if the transport died."""
+        try:
+            return self.connect().open_session(timeout=TIMEOUT)
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout):
+            with self._lock:
+                self._close()
+            return self.connect().open_session(timeout=TIMEOUT)
+
+    def execute(self, command: str, stdin: str | None = None) -> str:
+        """Run a command on its own channel and return its stdout."""
+        channel = self.start(command, stdin)
+        try:
+            with channel.makefile("rb") as stdout:
+                return stdout.read().decode()
+        finally:
+            channel.close()
+
+    def run(self, command: str, stdin: str | None = None) -> tuple[int, str, str]:
+        """Run a command and return its exit status, stdout and stderr."""
+        channel = self.start(command, stdin)
+        try:
+            with (
+                channel.makefile("rb") as stdout,
+                channel.makefile_stderr("rb") as stderr,
+            ):
+                output = stdout.read().decode(errors="replace")
+                errors = stderr.read().decode(errors="replace")
+            return channel.recv_exit_status(), output, errors
+        finally:
+            channel.close()
+
+    def start(self, command: str, stdin: str | None = None) -> paramiko.Channel:
+        """Start a command on a new channel and send its stdin."""
+        channel = self.open_channel()
+        try:
+            with self.timings.measure("exec"):
+                channel.exec_command(command)
+                if stdin:
+                    channel.sendall(stdin.encode())
+                channel.shutdown_write()
+        except BaseException:
+            channel.close()
+            raise
+        return channel
+
+    def close(self) -> None:
+        """Close the transport."""
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def read_lines(
+    channel: paramiko.Channel,
+    stats: dict[str, float] | None = None,
+    stop: threading.Event | None = None,
+) -> Iterator[str]:
+    """Yield a channel's stdout line by line and close it when done.
+
+    When `stats` is given it receives the time until the first byte, the
+    time spent waiting for the remaining data, the number of bytes read and
+    the exit status, which is -1 if the session ended before the command
+    finished. When `stop` is given, reading ends once it is set and reads
+    that time out are retried until then; the channel needs a timeout for
+    this.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(first_byte=0.0, transfer=0.0, bytes=0, status=-1)
+
+    def recv() -> bytes:
+        while True:
+            if stop is not None and stop.is_set():
+                return b""
+            try:
+                return channel.recv(READ_CHUNK_SIZE)
+            except socket.timeout:
+                if stop is None:
+                    raise
+
+    try:
+        pending = b""
+        start = time.perf_counter()
+        chunk = recv()
+        stats["first_byte"] = time.perf_counter() - start
+        while chunk:
+            stats["bytes"] += len(chunk)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.decode(errors="replace")
+            start = time.perf_counter()
+            chunk = recv()
+            stats["transfer"] += time.perf_counter() - start
+        if pending:
+            yield pending.decode(errors="replace")
+        # The exit status follows the end of the output.
+        if (stop is None or not stop.is_set()) and channel.status_event.wait(TIMEOUT):
+            stats["status"] = channel.exit_status
+    finally:
+        channel.close()
@@ -0,0 +1,271 @@
+"""Dovecot Quotas API over SSH and the doveadm command line."""
+
+import asyncio
+from collections.abc import Callable
+import contextlib
+import re
+import logging
+import shlex
+import socket
+import threading
+import time
+import paramiko
+
+from .api import CannotConnect, ConnectionStats, InvalidAuth, QuotasAPI, TransportError
+from .const import DEFAULT_SSH_PORT
+from .parser import parse_quota_lines
+from .snapshot import QuotaSnapshot
+from .ssh import SSHConnection, read_lines
+from .timing import PhaseTimings
+
+GET_QUOTA_CMD = "doveadm -f tab quota get -A"
+# Reads the user list from the channel's stdin, one user per line.
+GET_USER_QUOTA_CMD = "doveadm -f tab quota get -F /dev/stdin"
+GET_DOVECOT_VERSION_CMD = "doveadm --version"
+LIST_USERS_CMD = "doveadm user {mask}"
+# Reads the user list from the channel's stdin, one user per line.
+RECALC_QUOTA_CMD = "doveadm quota recalc -F /dev/stdin"
+# How often a watcher waiting for output checks whether it should stop.
+WATCH_POLL_INTERVAL = 1  # seconds
+
+# Per-user failures on stderr, e.g. "doveadm(user@example.com): Error: ...".
+USER_ERROR_RE = re.compile(
+    r"^doveadm\((?P<user>[^()\s]+)\)[^:]*: (?:Error|Fatal): (?P<message>.*)$",
+    re.MULTILINE,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SSHQuotasAPI(QuotasAPI):
+    """Run doveadm over a persistent SSH session."""
+
+    can_watch = True
+
+    _hostname: str
+    _username: str
+    _password: str
+
+    def __init__(
+        self,
+        hostname: str,
+        username: str,
+        password: str,
+        port: int = DEFAULT_SSH_PORT,
+        max_commands_per_minute: int | None = None,
+    ):
+        super().__init__(max_commands_per_minute)
+        self._hostname = hostname
+        self._username = username
+        self._password = password
+        self._connection = SSHConnection(hostname, username, password, port)
+        # Stop flags of the running watchers.
+        self._watchers: set[threading.Event] = set()
+
+    @property
+    def connection_stats(self) -> ConnectionStats:
+        """Return the connect/reuse/reconnect counters of the SSH session."""
+        return self._connection.stats
+
+    @property
+    def timings(self) -> PhaseTimings:
+        """Return the per-phase timings of the SSH session."""
+        return self._connection.timings
+
+    @property
+    def host_key(self) -> str | None:
+        """Return the fingerprint of the server's host key, once connected."""
+        return self._connection.host_key
+
+    async def get_version(self) -> str:
+        """Get the version of Dovecot installed on the server."""
+        output = await self.execute_command(GET_DOVECOT_VERSION_CMD)
+        version = re.search(r"(\d+\.\d+\.\d+\.\d+)", output)
+        return version.group() if version else ""
+
+    async def list_accounts(self, mask: str = "*") -> list[str]:
+        """List the users matching a mask without computing their quotas.
+
+        Raises CannotConnect when the users could not be listed.
+        """
+        output = await self._run_in_executor(self._list_accounts, mask)
+        return sorted({line.strip() for line in output.splitlines() if line.strip()})
+
+    async def _fetch_quotas(
+        self, accounts: list[str] | None, quotas: QuotaSnapshot
+    ) -> None:
+        """Run a quota command and parse its output as it streams in."""
+        if accounts is None:
+            await self._run_in_executor(
+                self._stream_quotas, GET_QUOTA_CMD, None, quotas
+            )
+        else:
+            await self._run_in_executor(
+                self._stream_quotas,
+                GET_USER_QUOTA_CMD,
+                "\n".join(accounts) + "\n",
+                quotas,
+            )
+
+    async def _recalc_quotas(self, accounts: list[str]) -> dict[str, str | None]:
+        """Recalculate a chunk of users on its own channel of the session."""
+        return await self._run_in_executor(self._recalc_chunk, accounts)
+
+    async def test_connection(self):
+        """Test the SSH connection to the server."""
+        await self._run_in_executor(self._test_connection)
+
+    async def execute_command(self, command: str, stdin: str | None = None) -> str:
+        """Execute a command on the server via SSH."""
+        return await self._run_in_executor(self._execute_command, command, stdin)
+
+    async def watch(
+        self,
+        command: str,
+        on_line: Callable[[str], None],
+        pattern: re.Pattern[str] | None = None,
+    ) -> None:
+        """Run a long-lived command, calling on_line for every output line.
+
+        The command is read on a thread of its own, so it doesn't hold on to
+        an executor worker, and only lines matching `pattern` are passed to
+        the event loop. Returns when the command exits or the session is
+        closed.
+        """
+        loop = asyncio.get_running_loop()
+        done: asyncio.Future[None] = loop.create_future()
+        stop = threading.Event()
+
+        def deliver(line: str) -> None:
+            # Lines still queued when the watch ended are dropped.
+            if not stop.is_set():
+                on_line(line)
+
+        def forward(line: str) -> None:
+            if pattern is None or pattern.search(line):
+                loop.call_soon_threadsafe(deliver, line)
+
+        def finish(error: BaseException | None) -> None:
+            if done.done():
+                return
+            if error is None:
+                done.set_result(None)
+            else:
+                done.set_exception(error)
+
+        def run() -> None:
+            error: BaseException | None = None
+            try:
+                self._watch(command, forward, stop)
+            except Exception as err:
+                error = err
+            # Nobody is waiting any more once the loop has been closed.
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe(finish, error)
+
+        self._watchers.add(stop)
+        try:
+            threading.Thread(
+                target=run, name=f"dovecot_quotas watcher {self._hostname}", daemon=True
+            ).start()
+            await done
+        finally:
+            stop.set()
+            self._watchers.discard(stop)
+
+    async def close(self) -> None:
+        """Stop the watchers and close the SSH session."""
+        for stop in self._watchers:
+            stop.set()
+        await self._run_in_executor(self._connection.close)
+
+    async def _run_in_executor(self, func, *args):
+        """Run a blocking paramiko call without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    def _test_connection(self) -> None:
+        """Make sure the SSH session is up (blocking)."""
+        try:
+            self._connection.connect()
+        except paramiko.AuthenticationException as e:
+            raise InvalidAuth from e
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout) as e:
+            raise CannotConnect(str(e)) from e
+
+    def _stream_quotas(
+        self, command: str, stdin: str | None, quotas: QuotaSnapshot
+    ) -> None:
+        """Run a quota command and parse its output into quotas (blocking)."""
+        stats: dict[str, float] = {}
+        try:
+            lines = read_lines(self._connection.start(command, stdin), stats)
+            start = time.perf_counter()
+            for record in parse_quota_lines(lines):
+                quotas.add(record)
+            elapsed = time.perf_counter() - start
+            if stats["status"] == -1:
+                raise TransportError("SSH session ended before the command finished")
+            if stats["status"]:
+                raise TransportError(
+                    f"Quota command failed: Exit status {stats['status']:.0f}"
+                )
+            timings = self.timings
+            timings.record("first_byte", stats["first_byte"])
+            timings.record("transfer", stats["transfer"])
+            timings.record("parse", elapsed - stats["first_byte"] - stats["transfer"])
+            timings.bytes_read = int(stats["bytes"])
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout) as e:
+            raise TransportError(f"SSH command failed: {e}") from e
+
+    def _recalc_chunk(self, accounts: list[str]) -> dict[str, str | None]:
+        """Recalculate the quota of a chunk of users (blocking)."""
+        try:
+            status, _, errors = self._connection.run(
+                RECALC_QUOTA_CMD, "\n".join(accounts) + "\n"
+            )
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout) as e:
+            _LOGGER.error("SSH command failed: %s", e)
+            return dict.fromkeys(accounts, str(e))
+        results: dict[str, str | None] = dict.fromkeys(accounts)
+        failed = False
+        for match in USER_ERROR_RE.finditer(errors):
+            if match.group("user") in results:
+                results[match.group("user")] = match.group("message")
+                failed = True
+        if status and not failed:
+            # The command failed as a whole, e.g. quota isn't enabled.
+            message = errors.strip() or f"Exit status {status}"
+            return dict.fromkeys(accounts, message)
+        return results
+
+    def _list_accounts(self, mask: str) -> str:
+        """Return the output of listing the users matching a mask (blocking)."""
+        try:
+            status, output, errors = self._connection.run(
+                LIST_USERS_CMD.format(mask=shlex.quote(mask))
+            )
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout) as e:
+            raise CannotConnect(f"SSH command failed: {e}") from e
+        if status:
+            raise CannotConnect(
+                f"Listing users failed: {errors.strip() or f'Exit status {status}'}"
+            )
+        return output
+
+    def _watch(
+        self, command: str, on_line: Callable[[str], None], stop: threading.Event
+    ) -> None:
+        """Forward the output of a long-lived command until stopped (blocking)."""
+        channel = self._connection.start(command)
+        channel.settimeout(WATCH_POLL_INTERVAL)
+        for line in read_lines(channel, stop=stop):
+            on_line(line)
+
+    def _execute_command(self, command: str, stdin: str | None = None) -> str:
+        """Execute a command on the server via SSH (blocking)."""
+        try:
+            return self._connection.execute(command, stdin)
+        except (paramiko.SSHException, EOFError, OSError, socket.timeout) as e:
+            _LOGGER.error("SSH command failed: %s", e)
+            return ""
@@ -0,0 +1,113 @@
+"""Usage threshold crossings for the Dovecot Quotas integration."""
+
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
+
+from .snapshot import STORAGE_KEYS, QuotaSnapshot
+
+UP = "up"
+DOWN = "down"
+
+
+class Crossing(NamedTuple):
+    """An account whose usage moved past a threshold."""
+
+    account: str
+    threshold: float
+    direction: str
+    percentage_used: float | None
+
+
+def parse_thresholds(value: str) -> list[float]:
+    """Parse a comma separated list of percentages, raising ValueError."""
+    thresholds = sorted({float(part) for part in value.split(",") if part.strip()})
+    if any(threshold <= 0 for threshold in thresholds):
+        raise ValueError("Thresholds must be above 0")
+    return thresholds
+
+
+class ThresholdMonitor:
+    """Track which usage threshold every account is at, with hysteresis.
+
+    An account reaches a threshold when its usage is at or above it, and
+    only drops back below it once usage falls `hysteresis` percentage points
+    under it, so usage hovering around a threshold doesn't flap. Only
+    accounts above the lowest threshold are kept, and after the first
+    snapshot only changed accounts are evaluated.
+    """
+
+    def __init__(self, thresholds: list[float], hysteresis: float) -> None:
+        self._thresholds = thresholds
+        self._hysteresis = hysteresis
+        # Number of thresholds reached, for accounts that reached at least one.
+        self._levels: dict[str, int] = {}
+        self._initialized = False
+
+    def update(
+        self, quotas: QuotaSnapshot, changes: dict[str, frozenset[str]]
+    ) -> list[Crossing]:
+        """Return the crossings since the previous snapshot.
+
+        The first snapshot only sets the baseline and reports nothing.
+        """
+        if not self._thresholds:
+            return []
+        if not self._initialized:
+            self._initialized = True
+            levels = self._levels
+            levels.clear()
+            # One pass over the columns; NaN != NaN skips unreported usage.
+            for account, used, quota in zip(quotas, quotas.used, quotas.quota):
+                if quota > 0 and used == used:
+                    if level := self._level(round(used / quota * 100, 1), 0):
+                        levels[account] = level
+            return []
+
+        crossings: list[Crossing] = []
+        thresholds = self._thresholds
+        for account, keys in changes.items():
+            if not keys & STORAGE_KEYS:
+                continue
+            current = self._levels.get(account, 0)
+            row = quotas.row(account)
+            percentage: float | None = None
+            if row is None:
+                # The account is gone; forget it without an event.
+                self._levels.pop(account, None)
+                continue
+            if quotas.quota[row] > 0 and quotas.used[row] == quotas.used[row]:
+                # Rounded like the percentage_used sensor.
+                percentage = round(quotas.used[row] / quotas.quota[row] * 100, 1)
+                level = self._level(percentage, current)
+            else:
+                # Usage or quota no longer reported; keep the last level.
+                level = current
+            if level == current:
+                continue
+            if level:
+                self._levels[account] = level
+            else:
+                self._levels.pop(account, None)
+            # One crossing per threshold passed, in the direction of travel.
+            if level > current:
+                crossings.extend(
+                    Crossing(account, threshold, UP, percentage)
+                    for threshold in thresholds[current:level]
+                )
+            else:
+                crossings.extend(
+                    Crossing(account, threshold, DOWN, percentage)
+                    for threshold in reversed(thresholds[level:current])
+                )
+        return crossings
+
+    def _level(self, percentage: float, current: int) -> int:
+        """Return the number of thresholds reached at a usage percentage."""
+        level = bisect_right(self._thresholds, percentage)
+        if level >= current:
+            return level
+        # Only drop below a threshold once usage is at least the hysteresis
+        # under it, i.e. stay at thresholds below percentage + hysteresis.
+        return min(
+            current, bisect_left(self._thresholds, percentage + self._hysteresis)
+        )
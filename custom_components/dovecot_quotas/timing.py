@@ -0,0 +1,84 @@
+"""Per-phase timing statistics for the Dovecot Quotas integration."""
+
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+import threading
+import time
+
+# Number of samples kept per phase for the rolling percentiles.
+WINDOW = 100
+
+PHASES = (
+    "wait",
+    "connect",
+    "auth",
+    "exec",
+    "first_byte",
+    "transfer",
+    "parse",
+    "diff",
+    "entity_writes",
+    "refresh",
+)
+
+
+def _percentile(samples: list[float], percentile: float) -> float | None:
+    """Return a percentile (0-100) of sorted samples."""
+    if not samples:
+        return None
+    return samples[round((len(samples) - 1) * percentile / 100)]
+
+
+class PhaseTimings:
+    """Rolling samples per phase, with the byte count of the last read.
+
+    Samples are recorded from executor threads, so the deques are only
+    touched under a lock and read through copies.
+    """
+
+    def __init__(self) -> None:
+        self._samples: dict[str, deque[float]] = {
+            phase: deque(maxlen=WINDOW) for phase in PHASES
+        }
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+
+    def record(self, phase: str, seconds: float) -> None:
+        """Add a sample to a phase."""
+        with self._lock:
+            self._samples[phase].append(seconds)
+
+    def _copy(self, phase: str) -> list[float]:
+        """Return the samples of a phase, oldest first."""
+        with self._lock:
+            return list(self._samples[phase])
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """Record how long the body of the with-block takes."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def percentile(self, phase: str, percentile: float) -> float | None:
+        """Return a percentile (0-100) of a phase's samples in seconds."""
+        return _percentile(sorted(self._copy(phase)), percentile)
+
+    def summary(self) -> dict[str, dict[str, float | None]]:
+        """Return the last, p50 and p95 value of every phase in milliseconds."""
+        summary: dict[str, dict[str, float | None]] = {}
+        for phase in self._samples:
+            samples = self._copy(phase)
+            last = samples[-1] if samples else None
+            samples.sort()
+            p50 = _percentile(samples, 50)
+            p95 = _percentile(samples, 95)
+            summary[phase] = {
+                "last": round(last * 1000, 1) if last is not None else None,
+                "p50": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return summary
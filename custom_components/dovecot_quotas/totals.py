@@ -0,0 +1,105 @@
+"""Server-wide quota totals for the Dovecot Quotas integration."""
+
+import heapq
+
+from .snapshot import STORAGE_KEYS, QuotaSnapshot
+
+USAGE_THRESHOLDS = (80, 90, 100)
+TOP_MAILBOXES = 10
+
+
+class ServerTotals:
+    """Totals over every account in the snapshot, updated from its changes.
+
+    Only accounts whose storage values changed are subtracted and added
+    again, so a refresh costs O(changed accounts) rather than O(accounts).
+    The largest mailboxes are only ranked again from scratch when an
+    account drops out of a full top.
+    """
+
+    def __init__(self) -> None:
+        self.used = 0.0
+        self.quota = 0.0
+        self.over: dict[int, int] = dict.fromkeys(USAGE_THRESHOLDS, 0)
+        self.largest: list[tuple[str, float]] = []
+        self._initialized = False
+
+    def _reset(self) -> None:
+        """Clear all totals."""
+        self.used = 0.0
+        self.quota = 0.0
+        self.over = dict.fromkeys(USAGE_THRESHOLDS, 0)
+
+    def update(
+        self,
+        quotas: QuotaSnapshot,
+        previous: QuotaSnapshot | None,
+        changes: dict[str, frozenset[str]],
+    ) -> None:
+        """Apply the changes since the previous snapshot.
+
+        previous only needs to hold the changed accounts; without it all
+        totals are computed again.
+        """
+        if not self._initialized or previous is None:
+            self._reset()
+            for account in quotas:
+                self._apply(quotas, account, 1)
+            self._initialized = True
+            self.largest = self._rank(quotas)
+            return
+        changed = [account for account, keys in changes.items() if keys & STORAGE_KEYS]
+        for account in changed:
+            self._apply(previous, account, -1)
+            self._apply(quotas, account, 1)
+        if changed:
+            self._update_largest(quotas, changed)
+
+    def _update_largest(self, quotas: QuotaSnapshot, changed: list[str]) -> None:
+        """Update the largest mailboxes from the changed accounts.
+
+        Changed accounts are ranked together with the current top. Only when
+        a full top loses an account or one of its accounts shrinks can an
+        unchanged account move up, and all accounts are ranked again.
+        """
+        top = dict(self.largest)
+        full = len(top) >= TOP_MAILBOXES
+        for account in changed:
+            used = quotas.get(account, "used")
+            if account in top and (used is None or used < top[account]):
+                if full:
+                    self.largest = self._rank(quotas)
+                    return
+                if used is None:
+                    del top[account]
+                    continue
+            if used is not None:
+                top[account] = used
+        self.largest = heapq.nlargest(
+            TOP_MAILBOXES, top.items(), key=lambda item: item[1]
+        )
+
+    @staticmethod
+    def _rank(quotas: QuotaSnapshot) -> list[tuple[str, float]]:
+        """Rank all accounts by their storage use."""
+        # NaN marks accounts without a STORAGE value; NaN != NaN skips them.
+        return heapq.nlargest(
+            TOP_MAILBOXES,
+            (
+                (account, used)
+                for account, used in zip(quotas, quotas.used)
+                if used == used
+            ),
+            key=lambda item: item[1],
+        )
+
+    def _apply(self, quotas: QuotaSnapshot, account: str, sign: int) -> None:
+        """Add (sign 1) or remove (sign -1) an account's contribution."""
+        if (used := quotas.get(account, "used")) is not None:
+            self.used += sign * used
+        if (quota := quotas.get(account, "quota")) is not None:
+            self.quota += sign * quota
+        if (percentage := quotas.get(account, "percentage_used")) is not None:
+            for threshold in USAGE_THRESHOLDS:
+                if percentage >= threshold:
+                    self.over[threshold] += sign
@@ -0,0 +1,48 @@
+"""Tests for the Dovecot Quotas integration."""
+
+import importlib.util
+import sys
+from pathlib import Path
+import types
+
+ROOT = Path(__file__).resolve().parents[1]
+PACKAGE = "custom_components.dovecot_quotas"
+
+
+def load_integration() -> None:
+    """Make the integration's modules importable without Home Assistant.
+
+    The package's __init__ sets up the config entry and needs Home
+    Assistant; the modules under test don't. The packages are registered
+    without running it, so `custom_components.dovecot_quotas.parser` and
+    friends import on their own. With Home Assistant installed the real
+    package is used, so it can also be set up as an integration.
+    """
+    if importlib.util.find_spec("homeassistant") is not None:
+        return
+    path = ROOT
+    for name in ("custom_components", PACKAGE):
+        path = path / name.rpartition(".")[2]
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = [str(path)]
+            sys.modules[name] = module
+
+
+load_integration()
+
+from custom_components.dovecot_quotas.parser import MESSAGE, STORAGE, QuotaRecord  # noqa: E402
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot  # noqa: E402
+
+
+def snapshot(**used: float | None) -> QuotaSnapshot:
+    """Return a snapshot with a 1000 KiB quota and the given usage per user.
+
+    Every user also has a MESSAGE row; None leaves out the STORAGE row.
+    """
+    quotas = QuotaSnapshot()
+    for account, value in used.items():
+        if value is not None:
+            quotas.add(QuotaRecord(account, "User quota", STORAGE, value, 1000.0))
+        quotas.add(QuotaRecord(account, "User quota", MESSAGE, 5.0, None))
+    return quotas
@@ -0,0 +1,84 @@
+"""Fixtures for the Dovecot Quotas tests."""
+
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+from . import load_integration
+
+load_integration()
+
+from custom_components.dovecot_quotas.const import (  # noqa: E402
+    BACKEND_SSH,
+    CONF_ACCOUNTS,
+    CONF_BACKEND,
+    CONF_HOSTNAME,
+    CONF_PASSWORD,
+    CONF_PORT,
+    CONF_USERNAME,
+    DOMAIN,
+)
+from custom_components.dovecot_quotas.ssh_api import SSHQuotasAPI  # noqa: E402
+
+from .fake_doveadm import FakeDoveadm, FakeSSHServer  # noqa: E402
+
+
+@pytest.fixture
+def local_sockets(request: pytest.FixtureRequest) -> None:
+    """Let the fake servers use localhost sockets when pytest-socket is active.
+
+    The Home Assistant test plugin blocks all sockets by default.
+    """
+    if request.config.pluginmanager.has_plugin("socket"):
+        request.getfixturevalue("socket_enabled")
+
+
+@pytest.fixture
+def doveadm() -> FakeDoveadm:
+    """Return a fake doveadm with 50 users."""
+    return FakeDoveadm(users=50)
+
+
+@pytest.fixture
+def ssh_server(doveadm: FakeDoveadm, local_sockets: None) -> Iterator[FakeSSHServer]:
+    """Serve the fake doveadm over SSH."""
+    with FakeSSHServer(doveadm) as server:
+        yield server
+
+
+@pytest.fixture
+def ssh_api(ssh_server: FakeSSHServer) -> Iterator[SSHQuotasAPI]:
+    """Return an SSH backend logged in to the fake server."""
+    api = SSHQuotasAPI(
+        "127.0.0.1", ssh_server.username, ssh_server.password, ssh_server.port
+    )
+    yield api
+    api._connection.close()
+
+
+@pytest.fixture
+def config_entry(hass: Any, ssh_server: FakeSSHServer) -> Any:
+    """Return a config entry for three users of the fake SSH server.
+
+    Needs the Home Assistant test plugin, which provides `hass`.
+    """
+    from pytest_homeassistant_custom_component.common import (  # noqa: PLC0415
+        MockConfigEntry,
+    )
+
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title="127.0.0.1",
+        unique_id="127.0.0.1",
+        data={
+            CONF_BACKEND: BACKEND_SSH,
+            CONF_HOSTNAME: "127.0.0.1",
+            CONF_USERNAME: ssh_server.username,
+            CONF_PORT: ssh_server.port,
+            CONF_PASSWORD: ssh_server.password,
+            CONF_ACCOUNTS: ssh_server.doveadm.users[:3],
+        },
+    )
+    entry.add_to_hass(hass)
+    return entry
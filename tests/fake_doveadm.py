@@ -0,0 +1,281 @@
+"""A fake doveadm and a local SSH server that runs it.
+
+FakeDoveadm answers the doveadm commands the integration sends, from an
+in-memory set of users. FakeSSHServer serves it over a real paramiko SSH
+server on localhost, with configurable latency and failure injection, so
+the SSH backend can be exercised end to end.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from fnmatch import fnmatchcase
+from functools import cache
+import queue
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+HEADER = "Username\tQuota name\tType\tValue\tLimit\t%"
+VERSION = "2.3.21.1 (47349e2482)"
+STORAGE_LIMIT = 1048576  # KiB
+MESSAGE_LIMIT = 100000
+SEND_CHUNK_SIZE = 32768
+
+
+@cache
+def host_key() -> paramiko.RSAKey:
+    """Return the server's host key, generated once per process."""
+    return paramiko.RSAKey.generate(2048)
+
+
+class FakeDoveadm:
+    """The users, quotas and log of a fake Dovecot server.
+
+    Every user has a STORAGE and a MESSAGE row in the "User quota" root.
+    `latency` delays every command's first byte, `failing_users` get a
+    per-user error from quota recalc, `quota_error` makes quota get exit
+    with that error after its output and `log` feeds the watch command.
+    """
+
+    def __init__(self, users: int = 100, latency: float = 0.0, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        self.version = VERSION
+        self.latency = latency
+        self.failing_users: set[str] = set()
+        self.quota_error: str | None = None
+        # Extra quota roots per user, as (root, type, value, limit) rows.
+        self.extra_roots: dict[str, list[tuple[str, str, float, float | None]]] = {}
+        self.storage: dict[str, float] = {}
+        self.messages: dict[str, float] = {}
+        for i in range(users):
+            user = username(i)
+            self.storage[user] = float(rng.randrange(STORAGE_LIMIT))
+            self.messages[user] = float(rng.randrange(MESSAGE_LIMIT))
+        self.commands: list[str] = []
+        self.recalculated: list[str] = []
+        self.log: queue.Queue[str] = queue.Queue()
+
+    @property
+    def users(self) -> list[str]:
+        """Return all usernames."""
+        return list(self.storage)
+
+    def quota_lines(self, users: list[str] | None = None) -> list[str]:
+        """Return 'doveadm -f tab quota get' output, for all users when None."""
+        lines = [HEADER]
+        for user in self.storage if users is None else users:
+            if user not in self.storage:
+                continue
+            used = self.storage[user]
+            lines.append(
+                f"{user}\tUser quota\tSTORAGE\t{used:.0f}\t{STORAGE_LIMIT}"
+                f"\t{used * 100 // STORAGE_LIMIT:.0f}"
+            )
+            messages = self.messages[user]
+            lines.append(
+                f"{user}\tUser quota\tMESSAGE\t{messages:.0f}\t{MESSAGE_LIMIT}"
+                f"\t{messages * 100 // MESSAGE_LIMIT:.0f}"
+            )
+            for root, type_, value, limit in self.extra_roots.get(user, ()):
+                lines.append(
+                    f"{user}\t{root}\t{type_}\t{value:.0f}\t"
+                    f"{'-' if limit is None else f'{limit:.0f}'}\t"
+                )
+        return lines
+
+    def quota_rows(self, users: list[str] | None = None) -> list[dict[str, str]]:
+        """Return the rows of a doveadm HTTP API quotaGet response."""
+        header = HEADER.lower().replace("quota name", "root").split("\t")
+        return [
+            dict(zip(header, line.split("\t"))) for line in self.quota_lines(users)[1:]
+        ]
+
+    def list_users(self, mask: str) -> list[str]:
+        """Return the users matching a doveadm user mask."""
+        return [user for user in self.storage if fnmatchcase(user, mask)]
+
+    def recalc(self, users: list[str]) -> dict[str, str | None]:
+        """Recalculate users, returning the error per user or None."""
+        results: dict[str, str | None] = {}
+        for user in users:
+            if user in self.failing_users or user not in self.storage:
+                results[user] = "Quota recalculation failed"
+            else:
+                results[user] = None
+                self.recalculated.append(user)
+        return results
+
+    def run(self, command: str, stdin: str) -> tuple[int, str, str]:
+        """Run a non-streaming command and return its status, stdout, stderr."""
+        self.commands.append(command)
+        users = [line for line in stdin.splitlines() if line]
+        if command == "doveadm --version":
+            return 0, self.version + "\n", ""
+        if command in (
+            "doveadm -f tab quota get -A",
+            "doveadm -f tab quota get -F /dev/stdin",
+        ):
+            output = "\n".join(self.quota_lines(users if "-F" in command else None))
+            if self.quota_error:
+                return 75, output + "\n", f"{self.quota_error}\n"
+            return 0, output + "\n", ""
+        if command.startswith("doveadm user "):
+            mask = command.removeprefix("doveadm user ").strip("'")
+            return 0, "".join(f"{user}\n" for user in self.list_users(mask)), ""
+        if command == "doveadm quota recalc -F /dev/stdin":
+            errors = "".join(
+                f"doveadm({user}): Error: {error}\n"
+                for user, error in self.recalc(users).items()
+                if error
+            )
+            return (75 if errors else 0), "", errors
+        return 127, "", f"sh: {command.split()[0]}: command not found\n"
+
+
+def username(i: int) -> str:
+    """Return the name of the i-th fake user."""
+    return f"user{i:06d}@example.com"
+
+
+class FakeSSHServer:
+    """Serve a FakeDoveadm over SSH on a random localhost port.
+
+    Commands starting with 'tail' stream the doveadm log until the channel
+    is closed. Failure injection:
+      - `refuse`: drop new connections before the SSH handshake.
+      - `drop_after`: close the transport after sending this many lines of
+        the next command's output, then reset.
+    Use as a context manager; `port` is set once it's listening.
+    """
+
+    def __init__(
+        self, doveadm: FakeDoveadm, username: str = "admin", password: str = "secret"
+    ) -> None:
+        self.doveadm = doveadm
+        self.username = username
+        self.password = password
+        self.refuse = False
+        self.drop_after: int | None = None
+        self.connections = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._transports: list[paramiko.Transport] = []
+        self._threads: list[threading.Thread] = []
+        self._stopped = threading.Event()
+        self.port = 0
+
+    def __enter__(self) -> FakeSSHServer:
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen()
+        self._socket.settimeout(0.1)
+        self.port = self._socket.getsockname()[1]
+        self._start(self._accept)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._stopped.set()
+        for transport in self._transports:
+            transport.close()
+        # Leave no threads behind for the next test.
+        for thread in [*self._threads, *self._transports]:
+            if thread.is_alive():
+                thread.join()
+        self._socket.close()
+
+    def disconnect(self) -> None:
+        """Close all open SSH sessions, as a restarting server would."""
+        for transport in self._transports:
+            transport.close()
+
+    def _start(self, target: Callable[..., None], *args: object) -> None:
+        """Run a function on a new server thread."""
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except (socket.timeout, OSError):
+                continue
+            if self.refuse:
+                client.close()
+                continue
+            self.connections += 1
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key())
+            self._transports.append(transport)
+            try:
+                transport.start_server(server=_Interface(self))
+            except (paramiko.SSHException, EOFError):
+                transport.close()
+
+    def _serve(self, channel: paramiko.Channel, command: str) -> None:
+        """Run a command on a channel (server thread)."""
+        try:
+            stdin = b""
+            while chunk := channel.recv(SEND_CHUNK_SIZE):
+                stdin += chunk
+            if self.doveadm.latency:
+                time.sleep(self.doveadm.latency)
+            if command.startswith("tail"):
+                self.doveadm.commands.append(command)
+                self._stream_log(channel)
+                return
+            status, stdout, stderr = self.doveadm.run(command, stdin.decode())
+            if stderr:
+                channel.sendall_stderr(stderr.encode())
+            if (drop_after := self.drop_after) is not None:
+                self.drop_after = None
+                lines = stdout.splitlines(keepends=True)[:drop_after]
+                channel.sendall("".join(lines).encode())
+                channel.get_transport().close()  # type: ignore[union-attr]
+                return
+            data = stdout.encode()
+            for start in range(0, len(data), SEND_CHUNK_SIZE):
+                channel.sendall(data[start : start + SEND_CHUNK_SIZE])
+            channel.send_exit_status(status)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
+
+    def _stream_log(self, channel: paramiko.Channel) -> None:
+        """Forward log lines until the client closes the channel."""
+        while not channel.closed and not self._stopped.is_set():
+            try:
+                line = self.doveadm.log.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            channel.sendall(f"{line}\n".encode())
+
+
+class _Interface(paramiko.ServerInterface):
+    """Accept password logins and exec requests."""
+
+    def __init__(self, server: FakeSSHServer) -> None:
+        self._server = server
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "password"
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        if (username, password) == (self._server.username, self._server.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(
+        self, channel: paramiko.Channel, command: bytes
+    ) -> bool:
+        self._server._start(self._server._serve, channel, command.decode())
+        return True
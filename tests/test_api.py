@@ -0,0 +1,163 @@
+"""Tests for the transport-agnostic part of QuotasAPI."""
+
+import asyncio
+
+import pytest
+
+from custom_components.dovecot_quotas import api as api_module
+from custom_components.dovecot_quotas.api import (
+    BREAKER_THRESHOLD,
+    CIRCUIT_OPEN_MESSAGE,
+    RETRY_ATTEMPTS,
+    QuotasAPI,
+    TransportError,
+)
+from custom_components.dovecot_quotas.parser import parse_quota_lines
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot
+
+from .fake_doveadm import FakeDoveadm
+
+FAIL_AFTER = 3
+
+
+class MemoryQuotasAPI(QuotasAPI):
+    """A backend that calls the fake doveadm directly.
+
+    The next `failures` quota queries add the first FAIL_AFTER records they
+    get, one account and the STORAGE row of the next, and then fail, like a
+    connection that drops halfway.
+    """
+
+    def __init__(self, doveadm: FakeDoveadm, failures: int = 0) -> None:
+        super().__init__()
+        self.doveadm = doveadm
+        self.failures = failures
+        self.queries: list[list[str] | None] = []
+        self.recalcs: list[list[str]] = []
+
+    async def get_version(self) -> str:
+        return self.doveadm.version
+
+    async def list_accounts(self, mask: str = "*") -> list[str]:
+        return self.doveadm.list_users(mask)
+
+    async def _fetch_quotas(
+        self, accounts: list[str] | None, quotas: QuotaSnapshot
+    ) -> None:
+        self.queries.append(accounts)
+        records = parse_quota_lines(self.doveadm.quota_lines(accounts))
+        for count, record in enumerate(records, 1):
+            quotas.add(record)
+            if self.failures and count == FAIL_AFTER:
+                self.failures -= 1
+                raise TransportError("Connection lost")
+
+    async def _recalc_quotas(self, accounts: list[str]) -> dict[str, str | None]:
+        self.recalcs.append(accounts)
+        return self.doveadm.recalc(accounts)
+
+    async def test_connection(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Retry straight away."""
+    monkeypatch.setattr(api_module, "RETRY_BASE_DELAY", 0)
+
+
+def test_backends_must_implement_the_transport() -> None:
+    """QuotasAPI itself can't be instantiated."""
+    with pytest.raises(TypeError):
+        QuotasAPI()  # type: ignore[abstract]
+
+
+def test_full_scan(doveadm: FakeDoveadm) -> None:
+    """Without accounts all users are fetched in one query."""
+    api = MemoryQuotasAPI(doveadm)
+    quotas = asyncio.run(api.get_quotas())
+    assert api.queries == [None]
+    assert len(quotas) == len(doveadm.users)
+    user = doveadm.users[0]
+    assert quotas.get(user, "used") == doveadm.storage[user]
+
+
+def test_targeted_queries_are_chunked(
+    doveadm: FakeDoveadm, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Selected accounts are fetched in chunks of QUOTA_CHUNK_SIZE."""
+    monkeypatch.setattr(api_module, "QUOTA_CHUNK_SIZE", 3)
+    api = MemoryQuotasAPI(doveadm)
+    accounts = doveadm.users[:7]
+    quotas = asyncio.run(api.get_quotas(accounts))
+    assert api.queries == [accounts[:3], accounts[3:6], accounts[6:]]
+    assert list(quotas) == accounts
+
+
+def test_full_scan_for_most_users(doveadm: FakeDoveadm) -> None:
+    """Once the server's size is known, large selections use the full scan."""
+    api = MemoryQuotasAPI(doveadm)
+    assert not api.use_full_scan(doveadm.users[:10])
+    asyncio.run(api.get_quotas())
+    assert api.use_full_scan(doveadm.users[:25])
+    assert not api.use_full_scan(doveadm.users[:24])
+
+
+def test_retry_asks_for_missing_accounts_only(doveadm: FakeDoveadm) -> None:
+    """A retried query skips the accounts that were already received."""
+    api = MemoryQuotasAPI(doveadm, failures=1)
+    accounts = doveadm.users[:3]
+    quotas = asyncio.run(api.get_quotas(accounts))
+    assert api.queries == [accounts, accounts[1:]]
+    assert list(quotas) == accounts
+    assert api.failed_accounts == set()
+
+
+def test_failed_accounts(doveadm: FakeDoveadm) -> None:
+    """Accounts still missing after the last attempt are reported."""
+    api = MemoryQuotasAPI(doveadm, failures=RETRY_ATTEMPTS)
+    accounts = doveadm.users[:5]
+    quotas = asyncio.run(api.get_quotas(accounts))
+    assert len(api.queries) == RETRY_ATTEMPTS
+    assert api.failed_accounts == set(accounts) - set(quotas)
+    assert len(quotas) == RETRY_ATTEMPTS
+
+
+def test_failed_full_scan(doveadm: FakeDoveadm) -> None:
+    """An interrupted full scan keeps what it got and sets scan_failed."""
+    api = MemoryQuotasAPI(doveadm, failures=RETRY_ATTEMPTS)
+    quotas = asyncio.run(api.get_quotas())
+    assert api.scan_failed
+    assert 0 < len(quotas) < len(doveadm.users)
+
+
+def test_circuit_breaker_stops_queries(doveadm: FakeDoveadm) -> None:
+    """After repeated failures the host isn't contacted for a while."""
+    api = MemoryQuotasAPI(doveadm, failures=BREAKER_THRESHOLD)
+
+    async def run() -> None:
+        for _ in range(-(-BREAKER_THRESHOLD // RETRY_ATTEMPTS)):
+            await api.get_quotas(doveadm.users[:1000])
+        assert api.circuit_open
+        queries = len(api.queries)
+        await api.get_quotas(doveadm.users[:5])
+        assert len(api.queries) == queries
+        assert api.failed_accounts == set(doveadm.users[:5])
+        results = await api.recalc_quotas(doveadm.users[:2])
+        assert results == dict.fromkeys(doveadm.users[:2], CIRCUIT_OPEN_MESSAGE)
+        assert api.recalcs == []
+
+    asyncio.run(run())
+
+
+def test_recalc_quotas(doveadm: FakeDoveadm, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Recalculation runs in chunks and reports errors per user."""
+    monkeypatch.setattr(api_module, "QUOTA_CHUNK_SIZE", 2)
+    doveadm.failing_users = {doveadm.users[1]}
+    api = MemoryQuotasAPI(doveadm)
+    results = asyncio.run(api.recalc_quotas(doveadm.users[:5]))
+    assert len(api.recalcs) == 3
+    assert results == {
+        user: "Quota recalculation failed" if user == doveadm.users[1] else None
+        for user in doveadm.users[:5]
+    }
@@ -0,0 +1,148 @@
+"""Tests for the config and options flows."""
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant import config_entries  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.data_entry_flow import FlowResultType  # noqa: E402
+from homeassistant.helpers import device_registry as dr  # noqa: E402
+from pytest_homeassistant_custom_component.common import MockConfigEntry  # noqa: E402
+
+from custom_components.dovecot_quotas.const import (  # noqa: E402
+    BACKEND_SSH,
+    CONF_ACCOUNTS,
+    CONF_BACKEND,
+    CONF_HOSTNAME,
+    CONF_PASSWORD,
+    CONF_PORT,
+    CONF_SERVER_TOTALS,
+    CONF_SSL,
+    CONF_THRESHOLDS,
+    CONF_USERNAME,
+    DOMAIN,
+)
+
+from .fake_doveadm import FakeSSHServer  # noqa: E402
+
+pytestmark = pytest.mark.usefixtures("enable_custom_integrations")
+
+
+async def test_user_flow(hass: HomeAssistant, ssh_server: FakeSSHServer) -> None:
+    """Logging in lists the server's accounts to choose from."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    assert result["type"] is FlowResultType.FORM
+
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"],
+        {
+            CONF_BACKEND: BACKEND_SSH,
+            CONF_HOSTNAME: "127.0.0.1",
+            CONF_PORT: ssh_server.port,
+            CONF_SSL: False,
+            CONF_USERNAME: ssh_server.username,
+            CONF_PASSWORD: "wrong",
+        },
+    )
+    assert result["errors"] == {"base": "invalid_auth"}
+
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"],
+        {
+            CONF_BACKEND: BACKEND_SSH,
+            CONF_HOSTNAME: "127.0.0.1",
+            CONF_PORT: ssh_server.port,
+            CONF_SSL: False,
+            CONF_USERNAME: ssh_server.username,
+            CONF_PASSWORD: ssh_server.password,
+        },
+    )
+    assert result["step_id"] == "accounts"
+
+    accounts = ssh_server.doveadm.users[:2]
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"], {CONF_ACCOUNTS: accounts}
+    )
+    assert result["type"] is FlowResultType.CREATE_ENTRY
+    assert result["data"][CONF_ACCOUNTS] == accounts
+    await hass.async_block_till_done()
+
+
+async def test_options_settings(
+    hass: HomeAssistant, config_entry: MockConfigEntry
+) -> None:
+    """Settings are validated and stored as options."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    result = await hass.config_entries.options.async_init(config_entry.entry_id)
+    assert result["type"] is FlowResultType.MENU
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {"next_step_id": "settings"}
+    )
+    assert result["step_id"] == "settings"
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {CONF_THRESHOLDS: "80, lots"}
+    )
+    assert result["errors"] == {CONF_THRESHOLDS: "invalid_thresholds"}
+
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {CONF_THRESHOLDS: "75, 95", CONF_SERVER_TOTALS: True}
+    )
+    assert result["type"] is FlowResultType.CREATE_ENTRY
+    assert config_entry.options[CONF_THRESHOLDS] == "75, 95"
+    assert config_entry.options[CONF_SERVER_TOTALS] is True
+    await hass.async_block_till_done()
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_options_accounts(
+    hass: HomeAssistant, config_entry: MockConfigEntry, ssh_server: FakeSSHServer
+) -> None:
+    """Changing the selection removes the devices of deselected accounts."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    first, second, third = config_entry.data[CONF_ACCOUNTS]
+    device_registry = dr.async_get(hass)
+    assert device_registry.async_get_device(identifiers={(DOMAIN, first)})
+
+    result = await hass.config_entries.options.async_init(config_entry.entry_id)
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {"next_step_id": "accounts"}
+    )
+    assert result["step_id"] == "accounts"
+    assert not result["errors"]
+
+    fourth = ssh_server.doveadm.users[3]
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {CONF_ACCOUNTS: [second, third, fourth]}
+    )
+    assert result["type"] is FlowResultType.ABORT
+    assert result["reason"] == "changes_successful"
+    assert config_entry.data[CONF_ACCOUNTS] == [second, third, fourth]
+    await hass.async_block_till_done()
+    assert not device_registry.async_get_device(identifiers={(DOMAIN, first)})
+    assert device_registry.async_get_device(identifiers={(DOMAIN, fourth)})
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_options_accounts_cannot_connect(
+    hass: HomeAssistant, config_entry: MockConfigEntry, ssh_server: FakeSSHServer
+) -> None:
+    """The current selection is shown while the server can't be reached."""
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    ssh_server.refuse = True
+    ssh_server.disconnect()
+
+    result = await hass.config_entries.options.async_init(config_entry.entry_id)
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], {"next_step_id": "accounts"}
+    )
+    assert result["errors"] == {"base": "cannot_connect"}
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
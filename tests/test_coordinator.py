@@ -0,0 +1,75 @@
+"""Tests for the coordinator running in Home Assistant."""
+
+from datetime import timedelta
+from typing import Any
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from freezegun.api import FrozenDateTimeFactory  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from pytest_homeassistant_custom_component.common import (  # noqa: E402
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.dovecot_quotas import group as group_module  # noqa: E402
+from custom_components.dovecot_quotas.const import (  # noqa: E402
+    CONF_ACCOUNTS,
+    DOMAIN,
+    SNAPSHOT_STORAGE_KEY,
+    STORE_SAVE_DELAY,
+)
+
+from .fake_doveadm import FakeSSHServer  # noqa: E402
+
+pytestmark = pytest.mark.usefixtures("enable_custom_integrations")
+
+
+@pytest.fixture(autouse=True)
+def no_stagger(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Don't delay scheduled refreshes."""
+    monkeypatch.setattr(group_module, "JITTER", 0)
+
+
+async def test_snapshot_saved_on_data_changes(
+    hass: HomeAssistant,
+    config_entry: MockConfigEntry,
+    ssh_server: FakeSSHServer,
+    hass_storage: dict[str, Any],
+    freezer: FrozenDateTimeFactory,
+) -> None:
+    """A refresh that only adds history samples doesn't save the snapshot."""
+    key = SNAPSHOT_STORAGE_KEY.format(entry_id=config_entry.entry_id)
+    accounts = config_entry.data[CONF_ACCOUNTS]
+
+    async def refresh() -> dict[str, frozenset[str]]:
+        coordinator.scheduler.poll_now(accounts)
+        await coordinator.async_refresh()
+        freezer.tick(timedelta(seconds=STORE_SAVE_DELAY + 1))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+        return coordinator.changes
+
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    freezer.tick(timedelta(seconds=STORE_SAVE_DELAY + 1))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert key in hass_storage
+
+    del hass_storage[key]
+    assert await refresh() == {}
+    assert key not in hass_storage
+
+    ssh_server.doveadm.storage[accounts[0]] += 1024
+    assert set(await refresh()) == {accounts[0]}
+    assert key in hass_storage
+
+    # Once an hour of samples is collected, the growth rate is reported.
+    freezer.tick(timedelta(hours=1))
+    ssh_server.doveadm.storage[accounts[1]] += 1024
+    assert "growth_rate" in (await refresh())[accounts[1]]
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
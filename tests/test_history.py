@@ -0,0 +1,65 @@
+"""Tests for the usage history and growth forecast."""
+
+import pytest
+
+from custom_components.dovecot_quotas.history import (
+    HISTORY_SIZE,
+    MIN_SPAN,
+    SECONDS_PER_DAY,
+    UsageHistory,
+    _Ring,
+)
+
+
+def test_slope_needs_two_samples_and_a_span() -> None:
+    """No rate is reported from one sample or too short a window."""
+    ring = _Ring(0)
+    ring.add(0, 100)
+    assert ring.slope() is None
+    ring.add(MIN_SPAN - 1, 200)
+    assert ring.slope() is None
+    ring.add(MIN_SPAN, 200)
+    assert ring.slope() is not None
+
+
+def test_slope_is_least_squares() -> None:
+    """A straight line is recovered exactly, in units per day."""
+    ring = _Ring(5000)
+    for hour in range(10):
+        ring.add(5000 + hour * 3600, 1000 + 50 * hour)
+    assert ring.slope() == pytest.approx(50 * 24)
+
+
+def test_slope_of_flat_usage() -> None:
+    """Unchanged usage grows by nothing."""
+    ring = _Ring(0)
+    for hour in range(5):
+        ring.add(hour * 3600, 42)
+    assert ring.slope() == pytest.approx(0)
+
+
+def test_ring_forgets_old_samples() -> None:
+    """Only the last HISTORY_SIZE samples count once the ring is full."""
+    ring = _Ring(0)
+    # A steep start that has to drop out of the window entirely.
+    for hour in range(HISTORY_SIZE):
+        ring.add(hour * 3600, 10000 * hour)
+    for hour in range(HISTORY_SIZE, 3 * HISTORY_SIZE):
+        ring.add(hour * 3600, 100 * hour)
+    assert ring.count == HISTORY_SIZE
+    assert ring.slope() == pytest.approx(100 * 24)
+
+
+def test_time_to_full() -> None:
+    """Days until full follow from the free space and the growth rate."""
+    history = UsageHistory()
+    assert history.growth_rate("alice") is None
+    for day in range(3):
+        history.add("alice", day * SECONDS_PER_DAY, 100 + 10 * day)
+    assert history.growth_rate("alice") == pytest.approx(10)
+    assert history.time_to_full("alice", 50) == pytest.approx(5)
+    assert history.time_to_full("alice", -5) == 0
+    assert history.time_to_full("alice", None) is None
+    for day in range(3, 6):
+        history.add("bob", day * SECONDS_PER_DAY, 100 - day)
+    assert history.time_to_full("bob", 50) is None
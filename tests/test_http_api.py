@@ -0,0 +1,209 @@
+"""Tests for the doveadm HTTP API backend against a local fake server."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+
+from custom_components.dovecot_quotas import api as api_module  # noqa: E402
+from custom_components.dovecot_quotas.api import CannotConnect, InvalidAuth  # noqa: E402
+from custom_components.dovecot_quotas.http_api import HTTPQuotasAPI  # noqa: E402
+
+from .fake_doveadm import FakeDoveadm  # noqa: E402
+
+USERNAME = "doveadm"
+PASSWORD = "secret"
+
+
+class FakeHTTPServer:
+    """Serve a FakeDoveadm as the doveadm HTTP API on a localhost port.
+
+    Set `status` to answer every request with that HTTP status instead.
+    """
+
+    def __init__(self, doveadm: FakeDoveadm) -> None:
+        self.doveadm = doveadm
+        self.status: int | None = None
+        self.requests: list[list[list[Any]]] = []
+        self.port = 0
+
+    async def __aenter__(self) -> "FakeHTTPServer":
+        app = web.Application()
+        app.router.add_route("*", "/doveadm/v1", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self._runner.cleanup()
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        try:
+            auth = aiohttp.BasicAuth.decode(request.headers.get("Authorization", ""))
+        except ValueError:
+            return web.Response(status=401)
+        if (auth.login, auth.password) != (USERNAME, PASSWORD):
+            return web.Response(status=401)
+        if self.status is not None:
+            return web.Response(status=self.status)
+        if request.method == "GET":
+            return web.json_response([{"command": "quotaGet"}])
+        commands = await request.json()
+        self.requests.append(commands)
+        return web.json_response(
+            [self._run(name, params, tag) for name, params, tag in commands]
+        )
+
+    def _run(self, name: str, params: dict[str, Any], tag: str) -> list[Any]:
+        doveadm = self.doveadm
+        if name == "user":
+            users = doveadm.list_users(params["userMask"][0])
+            return ["doveadmResponse", [{"username": user} for user in users], tag]
+        if name == "quotaGet" and params.get("allUsers"):
+            return ["doveadmResponse", doveadm.quota_rows(), tag]
+        user = params.get("user")
+        if user not in doveadm.storage:
+            return ["error", {"type": "exitCode", "exitCode": 67}, tag]
+        if name == "quotaGet":
+            rows = doveadm.quota_rows([user])
+            for row in rows:
+                del row["username"]
+            return ["doveadmResponse", rows, tag]
+        if name == "quotaRecalc":
+            if doveadm.recalc([user])[user]:
+                return ["error", {"type": "exitCode", "exitCode": 75}, tag]
+            return ["doveadmResponse", [], tag]
+        return ["error", {"type": "unknownCommand"}, tag]
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch: pytest.MonkeyPatch, local_sockets: None) -> None:
+    """Retry straight away."""
+    monkeypatch.setattr(api_module, "RETRY_BASE_DELAY", 0)
+
+
+def run_with_api(
+    doveadm: FakeDoveadm,
+    test: Callable[[HTTPQuotasAPI, FakeHTTPServer], Awaitable[None]],
+    password: str = PASSWORD,
+) -> None:
+    """Run a test against a fresh server and backend."""
+
+    async def run() -> None:
+        async with (
+            FakeHTTPServer(doveadm) as server,
+            aiohttp.ClientSession() as session,
+        ):
+            api = HTTPQuotasAPI(session, "127.0.0.1", server.port, USERNAME, password)
+            await test(api, server)
+
+    asyncio.run(run())
+
+
+def test_connection(doveadm: FakeDoveadm) -> None:
+    """The API accepts the credentials."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        await api.test_connection()
+        assert api.connection_stats is None
+
+    run_with_api(doveadm, test)
+
+
+def test_invalid_auth(doveadm: FakeDoveadm) -> None:
+    """Rejected credentials raise InvalidAuth."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        with pytest.raises(InvalidAuth):
+            await api.test_connection()
+
+    run_with_api(doveadm, test, password="wrong")
+
+
+def test_cannot_connect(doveadm: FakeDoveadm) -> None:
+    """Server errors raise CannotConnect."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        server.status = 503
+        with pytest.raises(CannotConnect):
+            await api.test_connection()
+
+    run_with_api(doveadm, test)
+
+
+def test_full_scan(doveadm: FakeDoveadm) -> None:
+    """All users come back from a single quotaGet."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        quotas = await api.get_quotas()
+        assert server.requests == [[["quotaGet", {"allUsers": True}, "c"]]]
+        assert list(quotas) == doveadm.users
+        user = doveadm.users[0]
+        assert quotas.get(user, "used") == doveadm.storage[user]
+        assert quotas.get(user, "messages") == doveadm.messages[user]
+
+    run_with_api(doveadm, test)
+
+
+def test_targeted_query_is_batched(doveadm: FakeDoveadm) -> None:
+    """Selected users are fetched in one request, one command per user.
+
+    Users the server returned an error for are reported as failed.
+    """
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        accounts = doveadm.users[:3] + ["nobody@example.com"]
+        quotas = await api.get_quotas(accounts)
+        assert len(server.requests) == 1
+        assert [tag for _, _, tag in server.requests[0]] == accounts
+        assert list(quotas) == accounts[:3]
+        assert api.failed_accounts == {"nobody@example.com"}
+
+    run_with_api(doveadm, test)
+
+
+def test_failed_full_scan(doveadm: FakeDoveadm) -> None:
+    """A failing server marks the scan as failed after the retries."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        server.status = 500
+        quotas = await api.get_quotas()
+        assert api.scan_failed
+        assert len(quotas) == 0
+
+    run_with_api(doveadm, test)
+
+
+def test_list_accounts(doveadm: FakeDoveadm) -> None:
+    """Users matching a mask are listed; failures raise CannotConnect."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        assert await api.list_accounts("user00001*") == doveadm.users[10:20]
+        server.status = 500
+        with pytest.raises(CannotConnect):
+            await api.list_accounts()
+
+    run_with_api(doveadm, test)
+
+
+def test_recalc_quotas(doveadm: FakeDoveadm) -> None:
+    """Recalculation is batched and reports the exit code per user."""
+
+    async def test(api: HTTPQuotasAPI, server: FakeHTTPServer) -> None:
+        doveadm.failing_users = {doveadm.users[1]}
+        results = await api.recalc_quotas(doveadm.users[:3])
+        assert len(server.requests) == 1
+        assert results == {
+            doveadm.users[0]: None,
+            doveadm.users[1]: "Exit code 75",
+            doveadm.users[2]: None,
+        }
+
+    run_with_api(doveadm, test)
@@ -0,0 +1,187 @@
+"""Tests for setting up the integration in Home Assistant."""
+
+import asyncio
+from datetime import timedelta
+from typing import Any
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from freezegun.api import FrozenDateTimeFactory  # noqa: E402
+from homeassistant.config_entries import ConfigEntryState  # noqa: E402
+from homeassistant.const import STATE_UNAVAILABLE  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import entity_registry as er  # noqa: E402
+from homeassistant.util import dt as dt_util  # noqa: E402
+from pytest_homeassistant_custom_component.common import (  # noqa: E402
+    MockConfigEntry,
+    async_fire_time_changed,
+)
+
+from custom_components.dovecot_quotas import api as api_module  # noqa: E402
+from custom_components.dovecot_quotas.group import RefreshGroup  # noqa: E402
+from custom_components.dovecot_quotas.const import (  # noqa: E402
+    CONF_ACCOUNTS,
+    CONF_STALE_AGE,
+    DOMAIN,
+    SNAPSHOT_STORAGE_KEY,
+    STORAGE_VERSION,
+)
+
+from . import snapshot  # noqa: E402
+from .fake_doveadm import FakeSSHServer  # noqa: E402
+
+pytestmark = pytest.mark.usefixtures("enable_custom_integrations")
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Retry straight away."""
+    monkeypatch.setattr(api_module, "RETRY_BASE_DELAY", 0)
+
+
+def sensor_state(
+    hass: HomeAssistant, entry: MockConfigEntry, account: str, key: str
+) -> str:
+    """Return the state of an account sensor."""
+    entity_id = er.async_get(hass).async_get_entity_id(
+        "sensor", DOMAIN, f"{entry.entry_id}-{account} {key}"
+    )
+    assert entity_id is not None
+    state = hass.states.get(entity_id)
+    assert state is not None
+    return state.state
+
+
+def save_snapshot(
+    hass_storage: dict[str, Any], entry: MockConfigEntry, **used: float | None
+) -> None:
+    """Store a snapshot for the entry as if it was saved an hour ago."""
+    key = SNAPSHOT_STORAGE_KEY.format(entry_id=entry.entry_id)
+    hass_storage[key] = {
+        "version": STORAGE_VERSION,
+        "minor_version": 1,
+        "key": key,
+        "data": {
+            "last_updated": (dt_util.now() - timedelta(hours=1)).isoformat(),
+            "quotas": snapshot(**used).as_dict(),
+        },
+    }
+
+
+async def test_setup_and_unload(
+    hass: HomeAssistant, config_entry: MockConfigEntry, ssh_server: FakeSSHServer
+) -> None:
+    """The selected accounts get sensors with the server's values."""
+    doveadm = ssh_server.doveadm
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    await hass.async_block_till_done()
+    assert config_entry.state is ConfigEntryState.LOADED
+
+    for account in config_entry.data[CONF_ACCOUNTS]:
+        messages = sensor_state(hass, config_entry, account, "messages")
+        assert float(messages) == doveadm.messages[account]
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.NOT_LOADED
+
+
+async def test_setup_retried_without_server(
+    hass: HomeAssistant, config_entry: MockConfigEntry, ssh_server: FakeSSHServer
+) -> None:
+    """Without a saved snapshot, setup waits for the server."""
+    ssh_server.refuse = True
+    assert not await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+
+
+async def test_restore_saved_snapshot(
+    hass: HomeAssistant,
+    config_entry: MockConfigEntry,
+    ssh_server: FakeSSHServer,
+    hass_storage: dict[str, Any],
+) -> None:
+    """A saved snapshot is shown while the server can't be reached."""
+    ssh_server.refuse = True
+    first, second, third = config_entry.data[CONF_ACCOUNTS]
+    save_snapshot(hass_storage, config_entry, **{first: 100.0, second: 250.0})
+
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.LOADED
+
+    assert sensor_state(hass, config_entry, first, "percentage_used") == "10.0"
+    assert sensor_state(hass, config_entry, second, "percentage_used") == "25.0"
+    assert sensor_state(hass, config_entry, third, "percentage_used") == "unknown"
+    assert sensor_state(hass, config_entry, first, "messages") == "5.0"
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_restored_snapshot_goes_stale(
+    hass: HomeAssistant,
+    config_entry: MockConfigEntry,
+    ssh_server: FakeSSHServer,
+    hass_storage: dict[str, Any],
+    freezer: FrozenDateTimeFactory,
+) -> None:
+    """Entities become unavailable once no refresh succeeded for stale_age."""
+    ssh_server.refuse = True
+    hass.config_entries.async_update_entry(config_entry, options={CONF_STALE_AGE: 2})
+    first, *_ = config_entry.data[CONF_ACCOUNTS]
+    save_snapshot(hass_storage, config_entry, **{first: 100.0})
+
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    freezer.tick(timedelta(minutes=59))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert sensor_state(hass, config_entry, first, "messages") == "5.0"
+
+    freezer.tick(timedelta(minutes=2))
+    async_fire_time_changed(hass)
+    await hass.async_block_till_done()
+    assert sensor_state(hass, config_entry, first, "messages") == STATE_UNAVAILABLE
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_restore_drops_deselected_accounts(
+    hass: HomeAssistant,
+    config_entry: MockConfigEntry,
+    ssh_server: FakeSSHServer,
+    hass_storage: dict[str, Any],
+) -> None:
+    """Accounts that are no longer selected aren't restored."""
+    ssh_server.refuse = True
+    first, *_ = config_entry.data[CONF_ACCOUNTS]
+    other = ssh_server.doveadm.users[10]
+    save_snapshot(hass_storage, config_entry, **{first: 100.0, other: 500.0})
+
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    assert list(coordinator.data[CONF_ACCOUNTS]) == [first]
+    assert coordinator.totals.used == 100.0
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
+
+
+async def test_refresh_after_restore_not_staggered(
+    hass: HomeAssistant,
+    config_entry: MockConfigEntry,
+    ssh_server: FakeSSHServer,
+    hass_storage: dict[str, Any],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The first refresh after restoring doesn't wait for the entry's slot."""
+    monkeypatch.setattr(RefreshGroup, "delay", lambda self, entry_id: 3600)
+    first, *_ = config_entry.data[CONF_ACCOUNTS]
+    save_snapshot(hass_storage, config_entry, **{first: 100.0})
+
+    assert await hass.config_entries.async_setup(config_entry.entry_id)
+    assert sensor_state(hass, config_entry, first, "messages") == "5.0"
+    async with asyncio.timeout(10):
+        await hass.async_block_till_done(wait_background_tasks=True)
+    messages = sensor_state(hass, config_entry, first, "messages")
+    assert float(messages) == ssh_server.doveadm.messages[first]
+
+    assert await hass.config_entries.async_unload(config_entry.entry_id)
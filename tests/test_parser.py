@@ -0,0 +1,87 @@
+"""Tests for the doveadm quota output parsers."""
+
+from custom_components.dovecot_quotas.parser import (
+    MESSAGE,
+    STORAGE,
+    QuotaRecord,
+    parse_quota_lines,
+    parse_quota_rows,
+)
+
+HEADER = "Username\tQuota name\tType\tValue\tLimit\t%"
+
+
+def test_parse_with_header() -> None:
+    """Rows are parsed by the columns named in the header."""
+    lines = [
+        HEADER,
+        "alice@example.com\tUser quota\tSTORAGE\t1024\t2048\t50",
+        "alice@example.com\tUser quota\tMESSAGE\t10\t-\t0",
+    ]
+    assert list(parse_quota_lines(lines)) == [
+        QuotaRecord("alice@example.com", "User quota", STORAGE, 1024.0, 2048.0),
+        QuotaRecord("alice@example.com", "User quota", MESSAGE, 10.0, None),
+    ]
+
+
+def test_parse_reordered_header() -> None:
+    """Columns are found by their title, not their position."""
+    lines = [
+        "Quota name\tUsername\tLimit\tValue\tType",
+        "User quota\tbob\t\t5\tSTORAGE",
+    ]
+    assert list(parse_quota_lines(lines)) == [
+        QuotaRecord("bob", "User quota", STORAGE, 5.0, None)
+    ]
+
+
+def test_parse_without_header() -> None:
+    """Without a header the default column order is used for every line."""
+    lines = ["carol\tUser quota\tSTORAGE\t1\t2\t50"]
+    assert list(parse_quota_lines(lines)) == [
+        QuotaRecord("carol", "User quota", STORAGE, 1.0, 2.0)
+    ]
+
+
+def test_parse_spaces_and_carriage_returns() -> None:
+    """Usernames and roots may hold spaces; trailing CRs are dropped."""
+    lines = [HEADER + "\r", "dave smith\tArchive quota\tSTORAGE\t7\t8\t87\r"]
+    assert list(parse_quota_lines(lines)) == [
+        QuotaRecord("dave smith", "Archive quota", STORAGE, 7.0, 8.0)
+    ]
+
+
+def test_parse_skips_bad_rows() -> None:
+    """Rows that are too short or hold no number are skipped."""
+    lines = [
+        HEADER,
+        "short\trow",
+        "erin\tUser quota\tSTORAGE\tlots\t8\t",
+        "frank\tUser quota\tSTORAGE\t3\t4\t75",
+    ]
+    assert [record.username for record in parse_quota_lines(lines)] == ["frank"]
+
+
+def test_parse_streams() -> None:
+    """Records are yielded as lines arrive, not after the last one."""
+
+    def lines():
+        yield HEADER
+        yield "gina\tUser quota\tSTORAGE\t1\t2\t50"
+        raise AssertionError("read too far")
+
+    assert next(parse_quota_lines(lines())).username == "gina"
+
+
+def test_parse_rows() -> None:
+    """HTTP API rows use the given username when they carry none."""
+    rows = [
+        {"root": "User quota", "type": "STORAGE", "value": "3", "limit": "4"},
+        {"root": "User quota", "type": "MESSAGE", "value": "1", "limit": "-"},
+        {"root": "User quota", "type": "STORAGE"},
+        {"username": "hank", "root": "r", "type": "STORAGE", "value": "x"},
+    ]
+    assert list(parse_quota_rows(rows, "ivy")) == [
+        QuotaRecord("ivy", "User quota", STORAGE, 3.0, 4.0),
+        QuotaRecord("ivy", "User quota", MESSAGE, 1.0, None),
+    ]
@@ -0,0 +1,119 @@
+"""Tests for polling, rate limiting and backoff."""
+
+import asyncio
+import time
+
+import pytest
+
+from custom_components.dovecot_quotas import scheduler
+from custom_components.dovecot_quotas.history import SECONDS_PER_DAY, UsageHistory
+from custom_components.dovecot_quotas.scheduler import (
+    AccountScheduler,
+    CircuitBreaker,
+    RateLimiter,
+    backoff_delay,
+)
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot
+
+from . import snapshot
+
+MIN_INTERVAL = 60
+MAX_INTERVAL = 3600
+
+
+def test_new_accounts_are_due() -> None:
+    """Accounts that were never polled are due straight away."""
+    accounts = AccountScheduler(MIN_INTERVAL, MAX_INTERVAL, UsageHistory())
+    assert accounts.due(["alice", "bob"], 0) == ["alice", "bob"]
+
+
+def test_dormant_account_polls_at_max_interval() -> None:
+    """An account with plenty of space and no growth polls slowly."""
+    accounts = AccountScheduler(MIN_INTERVAL, MAX_INTERVAL, UsageHistory())
+    accounts.update(["alice"], snapshot(alice=100), 1000)
+    assert accounts.next_poll("alice") == 1000 + MAX_INTERVAL
+    assert accounts.due(["alice"], 1000 + MAX_INTERVAL - 1) == []
+    assert accounts.due(["alice"], 1000 + MAX_INTERVAL) == ["alice"]
+
+
+def test_nearly_full_account_polls_faster() -> None:
+    """Below half free, the interval shrinks with the free space."""
+    accounts = AccountScheduler(MIN_INTERVAL, MAX_INTERVAL, UsageHistory())
+    accounts.update(["alice"], snapshot(alice=900), 0)
+    assert accounts.next_poll("alice") == pytest.approx(MAX_INTERVAL * 2 * 0.1)
+    accounts.update(["bob"], snapshot(bob=1000), 0)
+    assert accounts.next_poll("bob") == MIN_INTERVAL
+
+
+def test_growing_account_polls_before_it_fills_up() -> None:
+    """Fast growth brings the next poll forward."""
+    history = UsageHistory()
+    accounts = AccountScheduler(MIN_INTERVAL, SECONDS_PER_DAY, history)
+    # 100 KiB per hour leaves 6 hours until a quota of 1000 KiB is full.
+    for hour, used in enumerate((100, 200, 300, 400)):
+        now = hour * 3600
+        accounts.update(["alice"], snapshot(alice=used), now)
+    assert history.growth_rate("alice") == pytest.approx(100 * 24)
+    assert accounts.next_poll("alice") == pytest.approx(
+        now + 6 * 3600 / scheduler.SAFETY_FACTOR
+    )
+
+
+def test_unreported_account_waits() -> None:
+    """An account the server didn't report isn't asked for every tick."""
+    accounts = AccountScheduler(MIN_INTERVAL, MAX_INTERVAL, UsageHistory())
+    accounts.update(["ghost"], QuotaSnapshot(), 0)
+    assert accounts.next_poll("ghost") == MAX_INTERVAL
+
+
+def test_poll_now() -> None:
+    """poll_now makes accounts due on the next refresh."""
+    accounts = AccountScheduler(MIN_INTERVAL, MAX_INTERVAL, UsageHistory())
+    accounts.update(["alice"], snapshot(alice=100), 0)
+    accounts.poll_now(["alice"])
+    assert accounts.due(["alice"], 1) == ["alice"]
+
+
+def test_backoff_delay_is_jittered_and_capped() -> None:
+    """Delays double per attempt, stay in their upper half and are capped."""
+    for attempt, expected in ((0, 1), (1, 2), (2, 4), (5, 10)):
+        for _ in range(20):
+            delay = backoff_delay(attempt, 1, 10)
+            assert expected / 2 <= delay <= expected
+
+
+def test_circuit_breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The circuit opens at the threshold and reopens on one more failure."""
+    now = 1000.0
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now)
+    breaker = CircuitBreaker(3, 60, 3600)
+    breaker.failure()
+    breaker.failure()
+    assert not breaker.open
+    breaker.failure()
+    assert breaker.open
+    now += 60
+    assert not breaker.open
+    # Half-open: a single failure trips it again, for longer.
+    breaker.failure()
+    assert breaker.open
+    now += 60
+    assert breaker.open
+    now += 60
+    breaker.success()
+    assert not breaker.open
+    breaker.failure()
+    assert not breaker.open
+
+
+def test_rate_limiter() -> None:
+    """At most `limit` calls go through per period."""
+
+    async def acquire_all() -> float:
+        limiter = RateLimiter(2, period=0.2)
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire_all()) >= 0.19
@@ -0,0 +1,130 @@
+"""Tests for the columnar quota snapshot."""
+
+import json
+import math
+
+import pytest
+
+from custom_components.dovecot_quotas.parser import MESSAGE, STORAGE, QuotaRecord
+from custom_components.dovecot_quotas.snapshot import (
+    ALL_KEYS,
+    STORAGE_KEYS,
+    QuotaSnapshot,
+)
+
+from . import snapshot
+
+
+def test_add_and_get() -> None:
+    """Raw and derived values are available per account."""
+    quotas = snapshot(alice=250.0)
+    assert len(quotas) == 1
+    assert "alice" in quotas
+    assert list(quotas) == ["alice"]
+    assert quotas.get("alice", "name") == "alice"
+    assert quotas.get("alice", "used") == 250.0
+    assert quotas.get("alice", "quota") == 1000.0
+    assert quotas.get("alice", "free") == 750.0
+    assert quotas.get("alice", "percentage_used") == 25.0
+    assert quotas.get("alice", "percentage_free") == 75.0
+    assert quotas.get("alice", "messages") == 5.0
+    assert quotas.get("alice", "messages_quota") is None
+    assert quotas.get("bob", "used") is None
+
+
+def test_missing_storage() -> None:
+    """Accounts without a STORAGE row report no storage values."""
+    quotas = snapshot(alice=None)
+    assert quotas.get("alice", "used") is None
+    assert quotas.get("alice", "percentage_used") is None
+    assert math.isnan(quotas.used[quotas.row("alice")])
+
+
+def test_first_root_wins() -> None:
+    """Later roots for the same resource are ignored and recorded."""
+    quotas = snapshot(alice=250.0)
+    quotas.add(QuotaRecord("alice", "Archive", STORAGE, 900.0, 2000.0))
+    quotas.add(QuotaRecord("alice", "Archive", MESSAGE, 50.0, None))
+    assert quotas.get("alice", "used") == 250.0
+    assert quotas.ignored_roots == {"alice": {"Archive"}}
+
+
+def test_remove() -> None:
+    """Removed accounts lose their row and their ignored roots."""
+    quotas = snapshot(alice=1.0, bob=2.0, carol=3.0)
+    quotas.add(QuotaRecord("alice", "Archive", STORAGE, 9.0, None))
+    quotas.remove(["alice", "dave"])
+    assert list(quotas) == ["bob", "carol"]
+    assert quotas.get("carol", "used") == 3.0
+    assert quotas.get("alice", "used") is None
+    assert quotas.ignored_roots == {}
+
+
+def test_update_selected_accounts() -> None:
+    """Only the requested accounts are copied."""
+    quotas = snapshot(alice=1.0)
+    quotas.update(snapshot(alice=2.0, bob=3.0, carol=4.0), ["bob", "dave"])
+    assert list(quotas) == ["alice", "bob"]
+    assert quotas.get("alice", "used") == 1.0
+    assert quotas.get("bob", "used") == 3.0
+
+
+def test_diff() -> None:
+    """Changed, new and removed accounts are reported with their keys."""
+    previous = snapshot(alice=1.0, bob=2.0, carol=3.0)
+    current = snapshot(alice=1.0, bob=5.0, dave=4.0)
+    assert current.diff(previous) == {
+        "bob": STORAGE_KEYS,
+        "dave": ALL_KEYS,
+        "carol": ALL_KEYS,
+    }
+    assert current.diff(None) == dict.fromkeys(current, ALL_KEYS)
+    assert snapshot(alice=None).diff(snapshot(alice=None)) == {}
+
+
+def test_merge() -> None:
+    """Merging updates in place and returns the old rows of the changes."""
+    quotas = snapshot(alice=1.0, bob=2.0, carol=3.0)
+    previous, changes = quotas.merge(snapshot(alice=1.0, bob=5.0, dave=4.0))
+    assert changes == {"bob": STORAGE_KEYS, "dave": ALL_KEYS}
+    assert list(previous) == ["bob"]
+    assert previous.get("bob", "used") == 2.0
+    assert quotas.get("bob", "used") == 5.0
+    assert quotas.get("carol", "used") == 3.0
+    assert quotas.get("dave", "used") == 4.0
+
+
+def test_merge_selected_accounts() -> None:
+    """Accounts that weren't asked for are left alone."""
+    quotas = snapshot(alice=1.0)
+    _, changes = quotas.merge(snapshot(alice=2.0, bob=3.0), ["alice"])
+    assert changes == {"alice": STORAGE_KEYS}
+    assert "bob" not in quotas
+
+
+def test_merge_matches_diff() -> None:
+    """merge reports the same changes as diff against a rebuilt snapshot."""
+    base = {f"user{i}": float(i) for i in range(50)}
+    quotas = snapshot(**base)
+    fetched = {f"user{i}": float(i % 7) for i in range(0, 60, 3)}
+    expected = snapshot(**(base | fetched)).diff(snapshot(**base))
+    _, changes = quotas.merge(snapshot(**fetched))
+    assert changes == expected
+
+
+def test_as_dict_round_trip() -> None:
+    """The stored form survives JSON and restores NaN as missing."""
+    quotas = snapshot(alice=250.0, bob=None)
+    data = json.loads(json.dumps(quotas.as_dict()))
+    assert data["used"] == [250.0, None]
+    restored = QuotaSnapshot.from_dict(data)
+    assert restored.diff(quotas) == {}
+    assert restored.get("bob", "used") is None
+
+
+def test_from_dict_rejects_ragged_columns() -> None:
+    """Columns must have one value per account."""
+    data = snapshot(alice=1.0).as_dict()
+    data["quota"].append(1.0)
+    with pytest.raises(ValueError):
+        QuotaSnapshot.from_dict(data)
@@ -0,0 +1,255 @@
+"""Tests for the SSH backend against a local fake SSH server."""
+
+import asyncio
+import re
+import threading
+import time
+
+import pytest
+
+from custom_components.dovecot_quotas import api as api_module
+from custom_components.dovecot_quotas.api import CannotConnect, InvalidAuth
+from custom_components.dovecot_quotas.ssh_api import SSHQuotasAPI
+
+from .fake_doveadm import FakeDoveadm, FakeSSHServer
+
+QUOTA_LINE_RE = re.compile("quota", re.IGNORECASE)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Retry straight away."""
+    monkeypatch.setattr(api_module, "RETRY_BASE_DELAY", 0)
+
+
+def test_connection(ssh_api: SSHQuotasAPI) -> None:
+    """Logging in works and records the host key."""
+    asyncio.run(ssh_api.test_connection())
+    assert ssh_api.host_key
+
+
+def test_invalid_auth(ssh_server: FakeSSHServer) -> None:
+    """A wrong password raises InvalidAuth."""
+    api = SSHQuotasAPI("127.0.0.1", ssh_server.username, "wrong", ssh_server.port)
+    with pytest.raises(InvalidAuth):
+        asyncio.run(api.test_connection())
+
+
+def test_cannot_connect(ssh_server: FakeSSHServer) -> None:
+    """A server that drops the connection raises CannotConnect."""
+    ssh_server.refuse = True
+    api = SSHQuotasAPI(
+        "127.0.0.1", ssh_server.username, ssh_server.password, ssh_server.port
+    )
+    with pytest.raises(CannotConnect):
+        asyncio.run(api.test_connection())
+
+
+def test_version(ssh_api: SSHQuotasAPI) -> None:
+    """The version is read from 'doveadm --version'."""
+    assert asyncio.run(ssh_api.get_version()) == "2.3.21.1"
+
+
+def test_full_scan(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """All users are parsed from the streamed output."""
+    quotas = asyncio.run(ssh_api.get_quotas())
+    assert list(quotas) == doveadm.users
+    for user in doveadm.users:
+        assert quotas.get(user, "used") == doveadm.storage[user]
+        assert quotas.get(user, "messages") == doveadm.messages[user]
+    assert doveadm.commands == ["doveadm -f tab quota get -A"]
+
+
+def test_targeted_query(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """Selected users are passed on stdin."""
+    accounts = doveadm.users[10:13] + ["nobody@example.com"]
+    quotas = asyncio.run(ssh_api.get_quotas(accounts))
+    assert list(quotas) == accounts[:3]
+    assert doveadm.commands == ["doveadm -f tab quota get -F /dev/stdin"]
+
+
+def test_session_is_reused(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """Commands share one SSH session."""
+
+    async def run() -> None:
+        for _ in range(3):
+            await ssh_api.get_quotas(doveadm.users[:5])
+        await ssh_api.get_version()
+
+    asyncio.run(run())
+    assert ssh_server.connections == 1
+    stats = ssh_api.connection_stats
+    assert (stats.connects, stats.reuses, stats.reconnects) == (1, 3, 0)
+
+
+def test_reconnects_after_server_restart(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """A lost session is set up again for the next command."""
+
+    async def run() -> None:
+        await ssh_api.get_version()
+        ssh_server.disconnect()
+        await asyncio.sleep(0.1)
+        assert len(await ssh_api.get_quotas(doveadm.users[:5])) == 5
+
+    asyncio.run(run())
+    assert ssh_api.connection_stats.reconnects == 1
+
+
+def test_dropped_stream_is_retried(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """Output cut off by a lost session counts as a failure and is retried."""
+    ssh_server.drop_after = 5
+    accounts = doveadm.users[:10]
+    quotas = asyncio.run(ssh_api.get_quotas(accounts))
+    assert list(quotas) == accounts
+    assert ssh_api.failed_accounts == set()
+    assert len(doveadm.commands) == 2
+
+
+def test_dropped_full_scan_starts_over(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """Rows received before a drop don't count twice, as extra roots."""
+    ssh_server.drop_after = 11
+    quotas = asyncio.run(ssh_api.get_quotas())
+    assert list(quotas) == doveadm.users
+    assert quotas.ignored_roots == {}
+    assert not ssh_api.scan_failed
+
+
+def test_account_cut_off_is_retried(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """An account whose MESSAGE row was lost is asked for again."""
+    ssh_server.drop_after = 6
+    accounts = doveadm.users[:5]
+    quotas = asyncio.run(ssh_api.get_quotas(accounts))
+    for user in accounts:
+        assert quotas.get(user, "messages") == doveadm.messages[user]
+    assert ssh_api.failed_accounts == set()
+
+
+def test_failed_quota_command(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """A nonzero exit status fails the query, even with output."""
+    doveadm.quota_error = "Error: Quota not enabled"
+    accounts = doveadm.users[:5]
+    asyncio.run(ssh_api.get_quotas(accounts))
+    assert ssh_api.failed_accounts
+    assert len(doveadm.commands) == api_module.RETRY_ATTEMPTS
+
+    asyncio.run(ssh_api.get_quotas())
+    assert ssh_api.scan_failed
+
+
+def test_list_accounts(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """Users matching a mask are listed."""
+    accounts = asyncio.run(ssh_api.list_accounts("user00001*"))
+    assert accounts == doveadm.users[10:20]
+
+
+def test_list_accounts_fails(ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer) -> None:
+    """Listing raises CannotConnect instead of returning no users."""
+    ssh_server.refuse = True
+    with pytest.raises(CannotConnect):
+        asyncio.run(ssh_api.list_accounts())
+
+
+def test_recalc_quotas(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """Per-user errors on stderr are matched to their user."""
+    doveadm.failing_users = {doveadm.users[2]}
+    results = asyncio.run(ssh_api.recalc_quotas(doveadm.users[:4]))
+    assert results == {
+        user: "Quota recalculation failed" if user == doveadm.users[2] else None
+        for user in doveadm.users[:4]
+    }
+    assert doveadm.recalculated == doveadm.users[:2] + doveadm.users[3:4]
+
+
+def test_ignored_roots(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """Extra quota roots are reported instead of silently dropped."""
+    user = doveadm.users[0]
+    doveadm.extra_roots[user] = [("Archive", "STORAGE", 5.0, None)]
+    quotas = asyncio.run(ssh_api.get_quotas([user]))
+    assert quotas.get(user, "used") == doveadm.storage[user]
+    assert quotas.ignored_roots == {user: {"Archive"}}
+
+
+def test_loop_stays_responsive(ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm) -> None:
+    """The event loop keeps running while a slow command is in progress."""
+    doveadm.latency = 0.5
+
+    async def run() -> float:
+        lag = 0.0
+        task = asyncio.create_task(ssh_api.get_quotas())
+        while not task.done():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - start - 0.01)
+        await task
+        return lag
+
+    # Connecting happens in the executor too; include it in the measurement.
+    assert asyncio.run(run()) < 0.1
+
+
+def test_watch(
+    ssh_api: SSHQuotasAPI, ssh_server: FakeSSHServer, doveadm: FakeDoveadm
+) -> None:
+    """Only matching lines reach the loop; closing the API ends the watch."""
+    lines: list[str] = []
+    user = doveadm.users[0]
+
+    async def run() -> None:
+        watch = asyncio.create_task(
+            ssh_api.watch("tail -F /var/log/dovecot.log", lines.append, QUOTA_LINE_RE)
+        )
+        while not doveadm.commands:
+            await asyncio.sleep(0.01)
+        assert any(
+            thread.name.startswith("dovecot_quotas watcher")
+            for thread in threading.enumerate()
+        )
+        doveadm.log.put(f"imap({user})<1><abc>: Info: Disconnected: Logged out")
+        doveadm.log.put(f"imap({user})<1><abc>: Error: Quota exceeded (mailbox)")
+        while not lines:
+            await asyncio.sleep(0.01)
+        await ssh_api.close()
+        await asyncio.wait_for(watch, 5)
+
+    asyncio.run(run())
+    assert lines == [f"imap({user})<1><abc>: Error: Quota exceeded (mailbox)"]
+
+
+def test_cancelled_watch_stops_reading(
+    ssh_api: SSHQuotasAPI, doveadm: FakeDoveadm
+) -> None:
+    """Cancelling the watch task stops its thread."""
+    lines: list[str] = []
+
+    async def run() -> None:
+        watch = asyncio.create_task(ssh_api.watch("tail -F log", lines.append))
+        while not doveadm.commands:
+            await asyncio.sleep(0.01)
+        doveadm.log.put("before")
+        while not lines:
+            await asyncio.sleep(0.01)
+        watch.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await watch
+        doveadm.log.put("after")
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert lines == ["before"]
+    deadline = time.monotonic() + 5
+    while any(
+        thread.name.startswith("dovecot_quotas watcher")
+        for thread in threading.enumerate()
+    ):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
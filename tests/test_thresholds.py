@@ -0,0 +1,89 @@
+"""Tests for usage threshold crossings."""
+
+import pytest
+
+from custom_components.dovecot_quotas.snapshot import QuotaSnapshot
+from custom_components.dovecot_quotas.thresholds import (
+    DOWN,
+    UP,
+    Crossing,
+    ThresholdMonitor,
+    parse_thresholds,
+)
+
+from . import snapshot
+
+
+def step(
+    monitor: ThresholdMonitor, previous: QuotaSnapshot, **percentages: float
+) -> tuple[QuotaSnapshot, list[Crossing]]:
+    """Feed the next snapshot, with usage in percent, to the monitor."""
+    quotas = snapshot(**{a: p * 10 for a, p in percentages.items()})
+    return quotas, monitor.update(quotas, quotas.diff(previous))
+
+
+def test_parse_thresholds() -> None:
+    """Thresholds are sorted, deduplicated and must be positive."""
+    assert parse_thresholds("90, 80,,90") == [80.0, 90.0]
+    assert parse_thresholds("") == []
+    with pytest.raises(ValueError):
+        parse_thresholds("0, 50")
+    with pytest.raises(ValueError):
+        parse_thresholds("eighty")
+
+
+def test_baseline_reports_nothing() -> None:
+    """The first snapshot only sets the levels."""
+    monitor = ThresholdMonitor([80, 90], 2)
+    quotas = snapshot(alice=950)
+    assert monitor.update(quotas, quotas.diff(None)) == []
+    _, crossings = step(monitor, quotas, alice=95)
+    assert crossings == []
+
+
+def test_one_event_per_threshold() -> None:
+    """Jumping past several thresholds reports each of them in order."""
+    monitor = ThresholdMonitor([80, 90, 100], 2)
+    quotas = snapshot(alice=100)
+    monitor.update(quotas, quotas.diff(None))
+    quotas, crossings = step(monitor, quotas, alice=95)
+    assert crossings == [
+        Crossing("alice", 80, UP, 95.0),
+        Crossing("alice", 90, UP, 95.0),
+    ]
+    _, crossings = step(monitor, quotas, alice=10)
+    assert crossings == [
+        Crossing("alice", 90, DOWN, 10.0),
+        Crossing("alice", 80, DOWN, 10.0),
+    ]
+
+
+def test_hysteresis() -> None:
+    """Usage has to drop the hysteresis below a threshold to go down."""
+    monitor = ThresholdMonitor([80], 2)
+    quotas = snapshot(alice=800)
+    monitor.update(quotas, quotas.diff(None))
+    quotas, crossings = step(monitor, quotas, alice=78.5)
+    assert crossings == []
+    quotas, crossings = step(monitor, quotas, alice=78)
+    assert crossings == [Crossing("alice", 80, DOWN, 78.0)]
+    _, crossings = step(monitor, quotas, alice=80)
+    assert crossings == [Crossing("alice", 80, UP, 80.0)]
+
+
+def test_removed_account_is_forgotten() -> None:
+    """An account that disappears fires nothing and starts over."""
+    monitor = ThresholdMonitor([80], 0)
+    quotas = snapshot(alice=900)
+    monitor.update(quotas, quotas.diff(None))
+    quotas, crossings = step(monitor, quotas)
+    assert crossings == []
+    _, crossings = step(monitor, quotas, alice=90)
+    assert crossings == [Crossing("alice", 80, UP, 90.0)]
+
+
+def test_no_thresholds() -> None:
+    """Without thresholds nothing is tracked."""
+    monitor = ThresholdMonitor([], 2)
+    quotas = snapshot(alice=990)
+    assert monitor.update(quotas, quotas.diff(None)) == []
@@ -0,0 +1,38 @@
+"""Tests for the per-phase timing statistics."""
+
+import threading
+
+from custom_components.dovecot_quotas.timing import PhaseTimings
+
+
+def test_summary() -> None:
+    """The summary reports the last sample and percentiles in milliseconds."""
+    timings = PhaseTimings()
+    for seconds in (0.003, 0.001, 0.002):
+        timings.record("parse", seconds)
+    summary = timings.summary()
+    assert summary["parse"] == {"last": 2.0, "p50": 2.0, "p95": 3.0}
+    assert summary["connect"] == {"last": None, "p50": None, "p95": None}
+    assert timings.percentile("parse", 0) == 0.001
+
+
+def test_record_from_threads() -> None:
+    """Summaries can be taken while executor threads record samples."""
+    timings = PhaseTimings()
+    stop = threading.Event()
+
+    def record() -> None:
+        while not stop.is_set():
+            timings.record("transfer", 0.001)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(1000):
+            timings.summary()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert timings.summary()["transfer"]["p50"] == 1.0
@@ -0,0 +1,64 @@
+"""Tests for the server-wide totals."""
+
+import random
+
+from custom_components.dovecot_quotas.totals import TOP_MAILBOXES, ServerTotals
+
+from . import snapshot
+
+
+def full(used: dict[str, float]) -> ServerTotals:
+    """Return the totals computed from scratch."""
+    quotas = snapshot(**used)
+    totals = ServerTotals()
+    totals.update(quotas, None, quotas.diff(None))
+    return totals
+
+
+def test_totals() -> None:
+    """Usage, quota and accounts over each threshold are summed."""
+    totals = full({"alice": 850.0, "bob": 950.0, "carol": 1000.0, "dave": 10.0})
+    assert totals.used == 2810.0
+    assert totals.quota == 4000.0
+    assert totals.over == {80: 3, 90: 2, 100: 1}
+    assert totals.largest[0] == ("carol", 1000.0)
+
+
+def test_incremental_updates_match_full_recount() -> None:
+    """Merging targeted refreshes keeps the same totals and top mailboxes."""
+    rng = random.Random(1)
+    used = {f"user{i}": float(rng.randrange(1000)) for i in range(200)}
+    quotas = snapshot(**used)
+    totals = ServerTotals()
+    totals.update(quotas, None, quotas.diff(None))
+    for _ in range(200):
+        for account in (due := rng.sample(sorted(used), rng.randint(1, 20))):
+            used[account] = float(rng.randrange(1000))
+        previous, changes = quotas.merge(snapshot(**{a: used[a] for a in due}))
+        totals.update(quotas, previous, changes)
+        expected = full(used)
+        assert totals.used == expected.used
+        assert totals.over == expected.over
+        assert sorted(value for _, value in totals.largest) == sorted(
+            value for _, value in expected.largest
+        )
+    assert len(totals.largest) == TOP_MAILBOXES
+
+
+def test_small_top_shrinks_without_recount() -> None:
+    """With fewer accounts than the top holds, every account stays in it."""
+    quotas = snapshot(alice=500.0, bob=400.0)
+    totals = ServerTotals()
+    totals.update(quotas, None, quotas.diff(None))
+    previous, changes = quotas.merge(snapshot(alice=100.0))
+    totals.update(quotas, previous, changes)
+    assert totals.largest == [("bob", 400.0), ("alice", 100.0)]
+
+
+def test_unchanged_snapshot_keeps_totals() -> None:
+    """No storage changes leave the totals as they were."""
+    quotas = snapshot(alice=500.0)
+    totals = ServerTotals()
+    totals.update(quotas, None, quotas.diff(None))
+    totals.update(quotas, quotas, {})
+    assert totals.used == 500.0